@@ -1 +1,16 @@
+from django.contrib import admin
+from .models import OutgoingEmail
 
+
+class OutgoingEmailAdmin(admin.ModelAdmin):
+    """
+    Admin model class for the Outgoing Email model
+    """
+
+    list_display = ("subject", "status", "attempts", "next_attempt_at", "date_sent")
+    list_filter = ("status",)
+    ordering = ("-date_created",)
+    search_fields = ["subject"]
+
+
+admin.site.register(OutgoingEmail, OutgoingEmailAdmin)
@@ -0,0 +1,207 @@
+"""
+This file contains the tiered cache used throughout the project: a size bounded,
+in-process LRU tier in front of the shared Django cache backend.
+"""
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+
+
+_missing = object()
+
+# stored in the shared tier in place of None, which backends such as memcached
+# return for a miss as well
+_cached_none = "tiered_cache:none"
+
+
+class LocalLRUCache:
+    """
+    Thread safe in-process cache evicting the least recently used key once
+    `max_size` keys are stored. Entries expire after their own timeout.
+    """
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[1] <= time.monotonic():
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, timeout):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class _Load:
+    """A load of a key in progress, the threads missing the same key wait for its value"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = _missing
+
+
+class TieredCache:
+    """
+    Cache reading from the in-process tier first and the shared backend second.
+    Local entries live for at most `CACHE_LOCAL_TIMEOUT` seconds, which bounds how
+    long other workers may serve a value after it is deleted.
+    """
+
+    def __init__(self, alias="default", max_size=None, local_timeout=None):
+        self.alias = alias
+        self.local = LocalLRUCache(max_size or getattr(settings, "CACHE_LOCAL_MAX_SIZE", 1000))
+        if local_timeout is None:
+            local_timeout = getattr(settings, "CACHE_LOCAL_TIMEOUT", 5)
+        self.local_timeout = local_timeout
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.shared_hits = self.misses = self.loads = 0
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def _count(self, counter) -> None:
+        with self._stats_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _set_local(self, key, value, timeout):
+        if timeout is None or timeout is DEFAULT_TIMEOUT:
+            timeout = self.local_timeout
+        self.local.set(key, value, min(timeout, self.local_timeout))
+
+    def get(self, key, default=None):
+        value = self.local.get(key, _missing)
+        if value is not _missing:
+            return value
+
+        value = self.shared.get(key, _missing)
+        if value is _missing or value is None:
+            self._count("misses")
+            return default
+
+        self._count("shared_hits")
+        if value == _cached_none:
+            value = None
+        self._set_local(key, value, self.local_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT):
+        self.shared.set(key, _cached_none if value is None else value, timeout)
+        self._set_local(key, value, timeout)
+
+    def delete(self, key):
+        self.local.delete(key)
+        self.shared.delete(key)
+
+    def get_or_set(self, key, loader, timeout=DEFAULT_TIMEOUT, cache_none=True):
+        """
+        Function to return the cached value of `key`, calling `loader` on a miss.
+        Concurrent misses on the same key within a worker wait for a single load.
+        With `cache_none=False` a loaded None is returned without being cached.
+        """
+        value = self.get(key, _missing)
+        if value is not _missing:
+            return value
+
+        with self._inflight_lock:
+            load = self._inflight.get(key)
+            leader = load is None
+            if leader:
+                load = self._inflight[key] = _Load()
+
+        if not leader:
+            load.done.wait()
+            if load.value is not _missing:
+                return load.value
+            # the leader failed, the next miss leads a new load
+            return self.get_or_set(key, loader, timeout, cache_none)
+
+        try:
+            load.value = loader()
+            self._count("loads")
+            if load.value is not None or cache_none:
+                self.set(key, load.value, timeout)
+        finally:
+            # only the leader removes its load, waiters may still hold it
+            with self._inflight_lock:
+                del self._inflight[key]
+            load.done.set()
+
+        return load.value
+
+    def stats(self) -> dict:
+        """
+        Function to return the hit, miss, load and eviction counters of this worker
+        """
+        return {
+            "local_hits": self.local.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "loads": self.loads,
+            "evictions": self.local.evictions,
+            "local_size": len(self.local),
+        }
+
+
+tiered_cache = TieredCache()
+
+
+def cached(key, timeout=DEFAULT_TIMEOUT, cache_none=True):
+    """
+    Decorator caching the return value of a function in the tiered cache. `key` is
+    a format string filled with the function arguments, e.g. "user:email:{email}",
+    or a callable receiving the same arguments. With `cache_none=False` None results
+    are not cached.
+    """
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if callable(key):
+                cache_key = key(*args, **kwargs)
+            else:
+                cache_key = key.format(*args, **kwargs)
+
+            return tiered_cache.get_or_set(cache_key, lambda: func(*args, **kwargs), timeout, cache_none)
+
+        wrapper.invalidate = lambda *args, **kwargs: tiered_cache.delete(
+            key(*args, **kwargs) if callable(key) else key.format(*args, **kwargs)
+        )
+        return wrapper
+
+    return decorator
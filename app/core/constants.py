@@ -4,3 +4,6 @@ This file contains variable constants used throughout the project
 
 # Types of secret keys to be created for users for OTP generation
 otp_purpose = ["auth", "reset_password", "transactions", "logout"]
+
+# Validity of generated OTP codes in seconds, used for generation and verification
+otp_interval = 300
@@ -0,0 +1,24 @@
+"""
+This file contains database connection helpers used throughout the project
+"""
+
+from django.db import connections
+
+
+def pool_stats() -> dict:
+    """
+    Function to return the connection pool statistics of this process for each pooled
+    database alias. `saturation` is the share of the pool maximum checked out by requests.
+    """
+    stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], "pool", None)
+        if pool is None:
+            continue
+
+        alias_stats = pool.get_stats()
+        in_use = alias_stats.get("pool_size", 0) - alias_stats.get("pool_available", 0)
+        alias_stats["saturation"] = in_use / pool.max_size if pool.max_size else 0.0
+        stats[alias] = alias_stats
+
+    return stats
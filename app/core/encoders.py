@@ -0,0 +1,62 @@
+"""
+This file contains the encoding backends used by the renderers and middleware of this project.
+orjson is used for JSON when installed, with the standard library json module as fallback.
+MessagePack support requires the optional msgpack package.
+"""
+
+import json
+from decimal import Decimal
+
+from django.utils.functional import Promise
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+_fallback_encoder = JSONEncoder()
+
+
+def _default(obj):
+    """
+    Function to convert the types orjson does not support natively, the same way as DRF's encoder
+    """
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, Promise):
+        return str(obj)
+    return _fallback_encoder.default(obj)
+
+
+def json_dumps(data) -> bytes:
+    """
+    Function to encode data to compact UTF-8 JSON bytes. UUIDs, datetimes, decimals
+    and lazy translation strings are supported, non string keys are encoded as strings
+    like the standard library does, e.g. the indexes in `ListField` validation errors.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def msgpack_dumps(data) -> bytes:
+    """
+    Function to encode data to MessagePack bytes. Types without a MessagePack
+    equivalent are encoded as their JSON string form.
+    """
+    return msgpack.packb(data, default=_default, use_bin_type=True)
+
+
+def msgpack_loads(content: bytes):
+    """
+    Function to decode MessagePack bytes
+    """
+    return msgpack.unpackb(content, raw=False)
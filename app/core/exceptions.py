@@ -2,9 +2,21 @@
 This file contains custom exception handlers for format of responses of APIs in this project
 """
 
+from rest_framework import status
+from rest_framework.exceptions import APIException
 from rest_framework.views import exception_handler
 
 
+class ServiceUnavailable(APIException):
+    """
+    Exception raised when a bounded resource of the server is saturated
+    """
+
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Service temporarily unavailable, please try again later."
+    default_code = "service_unavailable"
+
+
 def custom_exception_handler(exc, context):
     """
     Function to assign custom exception handlers based on exception class
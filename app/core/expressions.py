@@ -0,0 +1,43 @@
+"""
+This file contains custom database expressions used throughout the project
+"""
+
+from django.db import NotSupportedError, models
+
+
+class JSONKeySet(models.Func):
+    """
+    Expression setting one top level key of a JSON column to a string in place, with
+    `jsonb_set` on PostgreSQL and `json_set` on SQLite. With `only_if_absent`
+    an existing value of the key is kept.
+    """
+
+    output_field = models.JSONField()
+
+    def __init__(self, field_name, key, value, only_if_absent=False):
+        super().__init__(models.F(field_name))
+        self.key = key
+        self.value = value
+        self.only_if_absent = only_if_absent
+
+    def as_sql(self, compiler, connection, **extra_context):
+        raise NotSupportedError(f"JSONKeySet is not supported on {connection.vendor}")
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        column, column_params = compiler.compile(self.source_expressions[0])
+        value, value_params = "to_jsonb(%s::text)", [self.value]
+        if self.only_if_absent:
+            value, value_params = f"COALESCE({column} -> %s, {value})", [*column_params, self.key, self.value]
+
+        sql = f"jsonb_set(COALESCE({column}, '{{}}'::jsonb), %s::text[], {value})"
+        return sql, [*column_params, [self.key], *value_params]
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        column, column_params = compiler.compile(self.source_expressions[0])
+        path = '$."%s"' % self.key
+        value, value_params = "%s", [self.value]
+        if self.only_if_absent:
+            value, value_params = f"COALESCE(JSON_EXTRACT({column}, %s), %s)", [*column_params, path, self.value]
+
+        sql = f"json_set(COALESCE({column}, '{{}}'), %s, {value})"
+        return sql, [*column_params, path, *value_params]
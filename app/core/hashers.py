@@ -0,0 +1,109 @@
+"""
+This file contains password hashers used throughout the project
+"""
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import (
+    PBKDF2PasswordHasher,
+    check_password,
+    get_hasher,
+    identify_hasher,
+    make_password,
+)
+
+
+_thread_name_prefix = "password-hashing"
+_executor = None
+_slots = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor, _slots
+
+    with _executor_lock:
+        if _executor is None:
+            workers = getattr(settings, "PASSWORD_HASHING_WORKERS", None) or os.cpu_count() or 1
+            queue_depth = getattr(settings, "PASSWORD_HASHING_QUEUE_DEPTH", 16)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=_thread_name_prefix)
+            _slots = threading.BoundedSemaphore(workers + queue_depth)
+
+    return _executor, _slots
+
+
+def _reset_executor():
+    global _executor, _slots, _executor_lock
+
+    # a forked process does not inherit the worker threads, it starts its own executor
+    _executor = _slots = None
+    _executor_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_reset_executor)
+
+
+def submit_hashing(func, *args, **kwargs):
+    """
+    Function to run a hashing call on the bounded hashing executor. Returns a future,
+    or raises `ServiceUnavailable` when all workers are busy and the queue is full.
+    """
+    # imported here, the DRF views it pulls in load the authentication classes importing the user models
+    from .exceptions import ServiceUnavailable
+
+    executor, slots = _get_executor()
+    if not slots.acquire(timeout=getattr(settings, "PASSWORD_HASHING_QUEUE_TIMEOUT", 0.5)):
+        raise ServiceUnavailable("Too many authentication requests, please try again shortly")
+
+    future = executor.submit(func, *args, **kwargs)
+    future.add_done_callback(lambda _: slots.release())
+
+    return future
+
+
+async def arun_hashing(func, *args, **kwargs):
+    """
+    Function to await a hashing call on the bounded hashing executor from async code
+    """
+    return await asyncio.wrap_future(submit_hashing(func, *args, **kwargs))
+
+
+async def acheck_password(user, raw_password) -> bool:
+    """
+    Async counterpart of `user.check_password`, hashing on the bounded executor and
+    upgrading the stored hash when the preferred hasher or its settings changed.
+    """
+    is_correct = await arun_hashing(check_password, raw_password, user.password)
+    if not is_correct:
+        return False
+
+    preferred = get_hasher("default")
+    hasher = identify_hasher(user.password)
+    if hasher.algorithm != preferred.algorithm or preferred.must_update(user.password):
+        user.password = await arun_hashing(make_password, raw_password)
+        await user.asave(update_fields=["password"])
+
+    return True
+
+
+class BoundedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    """
+    PBKDF2 hasher running on the bounded hashing executor, with the iteration count
+    taken from `PASSWORD_HASH_ITERATIONS`. Hashes using another iteration count
+    are upgraded by Django on the next successful login.
+    """
+
+    @property
+    def iterations(self):
+        return getattr(settings, "PASSWORD_HASH_ITERATIONS", None) or PBKDF2PasswordHasher.iterations
+
+    def encode(self, password, salt, iterations=None):
+        # already on a hashing worker, e.g. through `arun_hashing(check_password, ...)`
+        if threading.current_thread().name.startswith(_thread_name_prefix):
+            return super().encode(password, salt, iterations)
+
+        return submit_hashing(super().encode, password, salt, iterations).result()
@@ -0,0 +1,60 @@
+"""
+Management command to compare per-request database connections with reused connections
+"""
+
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from app.core.database import pool_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark a simulated request (a few queries) when the connection is closed after each request "
+        "against a connection kept open. With DATABASE_POOL enabled, closing returns the connection to the pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default", help="Database alias to benchmark.")
+        parser.add_argument("--requests", type=int, default=200, help="Requests simulated per mode.")
+        parser.add_argument("--queries", type=int, default=3, help="Queries run per simulated request.")
+
+    def time_requests(self, connection, requests, queries, close):
+        timings = []
+        for _ in range(requests):
+            start = time.perf_counter()
+            with connection.cursor() as cursor:
+                for _ in range(queries):
+                    cursor.execute("SELECT 1")
+                    cursor.fetchone()
+            if close:
+                connection.close()
+            timings.append(time.perf_counter() - start)
+
+        return timings
+
+    def report(self, name, timings):
+        timings = sorted(timings)
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(
+            f"{name}: mean {statistics.mean(timings) * 1000:.2f} ms, "
+            f"median {statistics.median(timings) * 1000:.2f} ms, p95 {p95 * 1000:.2f} ms"
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        pooled = getattr(connection, "pool", None) is not None
+        requests, queries = options["requests"], options["queries"]
+
+        per_request = self.time_requests(connection, requests, queries, close=True)
+        self.report("pool checkout per request" if pooled else "new connection per request", per_request)
+
+        reused = self.time_requests(connection, requests, queries, close=False)
+        self.report("reused connection", reused)
+        connection.close()
+
+        for alias, stats in pool_stats().items():
+            self.stdout.write(f"{alias} pool: {stats}")
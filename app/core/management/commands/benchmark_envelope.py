@@ -0,0 +1,96 @@
+"""
+Management command to compare the single pass response envelope with the previous deepcopy and re-encode
+"""
+
+import copy
+import json
+import timeit
+import uuid
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.test import RequestFactory
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from config.middleware.response import BaseAPIResponseMiddleware
+
+
+class BenchmarkView(APIView):
+    authentication_classes = []
+    permission_classes = []
+    payload = None
+
+    def get(self, request):
+        return Response(self.payload)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the CPU time per response of BaseAPIResponseMiddleware, wrapping the envelope before "
+        "DRF renders it, against rendering, deep-copying and re-encoding the response with DjangoJSONEncoder."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=500, help="Responses timed per payload.")
+
+    def get_payloads(self):
+        # shaped like serializer output, which formats ids, decimals and dates as strings
+        now = serializers.DateTimeField().to_representation(timezone.now())
+
+        def row():
+            return {
+                "id": str(uuid.uuid4()),
+                "email": "user@example.com",
+                "is_confirmed": True,
+                "amount": "1250.50",
+                "date_created": now,
+                "date_modified": now,
+            }
+
+        return {
+            "single": {"result": row()},
+            "list of 100": {
+                "count": 100,
+                "count_type": "exact",
+                "page_size": 100,
+                "results": [row() for _ in range(100)],
+            },
+        }
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        middleware = BaseAPIResponseMiddleware(lambda request: None)
+        request = RequestFactory().get("/")
+
+        for name, payload in self.get_payloads().items():
+            view = BenchmarkView.as_view(payload=payload)
+
+            def before():
+                # the previous middleware: DRF renders, then the envelope is deep-copied and encoded again
+                response = view(request)
+                response.render()
+                rendered = SimpleNamespace(data=copy.deepcopy(response.data), status_code=response.status_code)
+                response_data = middleware.render_response(rendered)
+                response.status_code = response_data.pop("status_http")
+                response.data = response_data
+                response.content = json.dumps(response_data, cls=DjangoJSONEncoder)
+                return response
+
+            def after():
+                response = middleware.handle_template_response(request, view(request))
+                response.render()
+                return middleware.process_response(request, response)
+
+            if json.loads(before().content) != json.loads(after().content):
+                raise CommandError(f"{name}: the two envelopes differ")
+
+            previous = timeit.timeit(before, number=number)
+            current = timeit.timeit(after, number=number)
+            self.stdout.write(
+                f"{name}: deepcopy and re-encode {previous / number * 1e6:.1f} us, "
+                f"single pass {current / number * 1e6:.1f} us ({previous / current:.1f}x)"
+            )
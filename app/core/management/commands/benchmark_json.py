@@ -0,0 +1,76 @@
+"""
+Management command to compare the project encoding backends with the standard library JSON encoder
+"""
+
+import json
+import timeit
+import uuid
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+
+from app.core.encoders import json_dumps, msgpack, msgpack_dumps, msgpack_loads, orjson
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark app.core.encoders.json_dumps, and msgpack_dumps when msgpack is installed, "
+        "against json.dumps with DjangoJSONEncoder."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=1000, help="Encodings timed per payload.")
+
+    def get_payloads(self):
+        now = timezone.now()
+
+        def row():
+            return {
+                "id": uuid.uuid4(),
+                "email": "user@example.com",
+                "is_confirmed": True,
+                "amount": Decimal("1250.50"),
+                "date_created": now,
+                "date_modified": now,
+            }
+
+        return {
+            "single": {"status": 200, "success": True, "message": _("Success"), "result": row()},
+            "list of 100": {
+                "count": 100,
+                "page_size": 100,
+                "status": 200,
+                "success": True,
+                "message": _("Success"),
+                "results": [row() for _ in range(100)],
+            },
+        }
+
+    def handle(self, *args, **options):
+        number = options["number"]
+        backend = "orjson" if orjson is not None else "stdlib json"
+
+        for name, payload in self.get_payloads().items():
+            stdlib = timeit.timeit(lambda: json.dumps(payload, cls=DjangoJSONEncoder).encode(), number=number)
+            project = timeit.timeit(lambda: json_dumps(payload), number=number)
+            self.stdout.write(
+                f"{name}: DjangoJSONEncoder {stdlib / number * 1e6:.1f} us, "
+                f"{backend} {project / number * 1e6:.1f} us ({stdlib / project:.1f}x)"
+            )
+
+            if msgpack is None:
+                continue
+
+            content = json_dumps(payload)
+            packed = msgpack_dumps(payload)
+            encode = timeit.timeit(lambda: msgpack_dumps(payload), number=number)
+            decode = timeit.timeit(lambda: msgpack_loads(packed), number=number)
+            json_decode = timeit.timeit(lambda: json.loads(content), number=number)
+            self.stdout.write(
+                f"{name}: JSON {len(content)} bytes, decode {json_decode / number * 1e6:.1f} us; "
+                f"MessagePack {len(packed)} bytes, encode {encode / number * 1e6:.1f} us, "
+                f"decode {decode / number * 1e6:.1f} us"
+            )
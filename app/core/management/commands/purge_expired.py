@@ -0,0 +1,53 @@
+"""
+Management command to purge expired rows according to the retention policies
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from app.core.retention import retention_policies
+
+
+class Command(BaseCommand):
+    help = "Delete expired OTPs and tokens in small batches, reporting throughput and the remaining backlog."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--policy", action="append", choices=sorted(retention_policies), help="Policies to run.")
+        parser.add_argument("--batch-size", type=int, default=None, help="Rows deleted per batch.")
+        parser.add_argument("--sleep", type=float, default=None, help="Seconds to wait between batches.")
+        parser.add_argument("--loop", action="store_true", help="Keep running every --interval seconds.")
+        parser.add_argument("--interval", type=float, default=3600)
+
+    def handle(self, *args, **options):
+        names = options["policy"] or sorted(retention_policies)
+        if options["interval"] <= 0:
+            raise CommandError("--interval must be positive")
+
+        try:
+            while True:
+                for name in names:
+                    self.run_policy(retention_policies[name], options)
+                if not options["loop"]:
+                    break
+                time.sleep(options["interval"])
+        except KeyboardInterrupt:
+            # batches are committed one at a time, stopping between them loses nothing
+            self.stdout.write("Stopped")
+
+    def run_policy(self, policy, options):
+        for using in policy.get_databases():
+            start = time.perf_counter()
+            stdout = self.stdout if options["verbosity"] > 1 else None
+            deleted = policy.purge(
+                batch_size=options["batch_size"], sleep=options["sleep"], stdout=stdout, using=using
+            )
+            elapsed = time.perf_counter() - start
+
+            name = policy.name if using is None else f"{policy.name} ({using})"
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"{name}: deleted {deleted} row(s) in {elapsed:.1f}s "
+                    f"({deleted / elapsed if elapsed else 0:.0f} rows/sec), {policy.backlog(using)} remaining"
+                )
+            )
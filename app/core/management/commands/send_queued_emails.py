@@ -0,0 +1,101 @@
+"""
+Management command to deliver the emails queued in the `OutgoingEmail` outbox
+"""
+
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+from django.db import connection as db_connection, transaction
+from django.utils import timezone
+
+from app.core.models import OutgoingEmail
+from app.core.utils import Util
+
+
+class Command(BaseCommand):
+    help = "Send queued emails in batches over a single mail connection, retrying failures with backoff."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=settings.EMAIL_OUTBOX_BATCH_SIZE)
+        parser.add_argument("--loop", action="store_true", help="Keep polling the outbox instead of exiting.")
+        parser.add_argument("--sleep", type=float, default=5, help="Seconds to wait when the outbox is empty.")
+
+    def handle(self, *args, **options):
+        while True:
+            sent = self.drain(options["batch_size"])
+            if sent:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+
+    def claim(self, batch_size):
+        """
+        Function to lease a batch of due emails to this worker in a short transaction, so the
+        rows are not locked while the emails are sent.
+        """
+        with transaction.atomic():
+            queryset = OutgoingEmail.objects.due()
+            if db_connection.features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            batch = list(queryset[:batch_size])
+            if not batch:
+                return []
+
+            lease_until = timezone.now() + timedelta(seconds=settings.EMAIL_OUTBOX_LEASE_SECONDS)
+            OutgoingEmail.objects.filter(pk__in=[outgoing.pk for outgoing in batch]).update(
+                status="SENDING", next_attempt_at=lease_until
+            )
+
+        return batch
+
+    def drain(self, batch_size):
+        """
+        Function to send one batch of due emails, returns the number of emails processed.
+        """
+        batch = self.claim(batch_size)
+        if not batch:
+            return 0
+
+        sent = failed = 0
+        mail_connection = get_connection()
+        try:
+            mail_connection.open()
+        except Exception as exc:
+            for outgoing in batch:
+                self.schedule_retry(outgoing, exc)
+            self.stderr.write(f"Could not open the mail connection: {exc}")
+            return len(batch)
+
+        try:
+            for outgoing in batch:
+                try:
+                    Util.build_email(outgoing, connection=mail_connection).send()
+                except Exception as exc:
+                    self.schedule_retry(outgoing, exc)
+                    failed += 1
+                else:
+                    outgoing.status = "SENT"
+                    outgoing.date_sent = timezone.now()
+                    outgoing.attempts += 1
+                    outgoing.save(update_fields=["status", "date_sent", "attempts"])
+                    sent += 1
+        finally:
+            mail_connection.close()
+
+        self.stdout.write(f"Sent {sent} email(s), {failed} failed")
+        return len(batch)
+
+    def schedule_retry(self, outgoing, exc):
+        outgoing.attempts += 1
+        outgoing.last_error = str(exc)
+        if outgoing.attempts >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            outgoing.status = "FAILED"
+        else:
+            outgoing.status = "PENDING"
+            backoff = settings.EMAIL_OUTBOX_BACKOFF_SECONDS * 2 ** (outgoing.attempts - 1)
+            outgoing.next_attempt_at = timezone.now() + timedelta(seconds=backoff)
+        outgoing.save(update_fields=["attempts", "last_error", "status", "next_attempt_at"])
@@ -0,0 +1,51 @@
+"""
+Management command to benchmark the password hasher and suggest an iteration count
+"""
+
+import statistics
+import time
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = "Benchmark PBKDF2 on this host and suggest PASSWORD_HASH_ITERATIONS for a target hashing time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--target-ms", type=float, default=250, help="Target time for one hash in milliseconds.")
+        parser.add_argument("--rounds", type=int, default=5, help="Number of hashes timed per measurement.")
+
+    def time_hash(self, iterations, rounds):
+        hasher = PBKDF2PasswordHasher()
+        salt = hasher.salt()
+        timings = []
+        for _ in range(rounds):
+            start = time.perf_counter()
+            hasher.encode("benchmark-password", salt, iterations)
+            timings.append(time.perf_counter() - start)
+
+        return statistics.median(timings) * 1000
+
+    def handle(self, *args, **options):
+        current = get_hasher("default")
+        current_iterations = getattr(current, "iterations", PBKDF2PasswordHasher.iterations)
+
+        current_ms = self.time_hash(current_iterations, options["rounds"])
+        self.stdout.write(f"Current hasher: {current.algorithm}, {current_iterations} iterations, {current_ms:.1f} ms")
+
+        # PBKDF2 cost grows linearly with the iteration count
+        suggested = int(current_iterations * options["target_ms"] / current_ms)
+        suggested_ms = self.time_hash(suggested, options["rounds"])
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Suggested PASSWORD_HASH_ITERATIONS={suggested} ({suggested_ms:.1f} ms, "
+                f"target {options['target_ms']:.0f} ms)"
+            )
+        )
+        if suggested < PBKDF2PasswordHasher.iterations:
+            self.stdout.write(
+                self.style.WARNING(
+                    f"The suggestion is below Django's default of {PBKDF2PasswordHasher.iterations} iterations"
+                )
+            )
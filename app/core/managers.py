@@ -0,0 +1,89 @@
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import models
+from django.utils import timezone
+from .cache import tiered_cache
+
+
+class CachedLookupMixin:
+    """
+    Manager mixin caching the primary key matched by single object lookups on the fields
+    listed in `cached_lookup_fields` in the tiered cache. Only the primary key of existing
+    objects is cached, never the row, which may hold secrets, and never a miss, since
+    lookup values may come from client input. Call `invalidate_cached` when an instance
+    is created, changed or deleted.
+    """
+
+    cached_lookup_fields = ()
+    cached_lookup_timeout = DEFAULT_TIMEOUT
+
+    def cached_lookup_key(self, field, value) -> str:
+        return f"{self.model._meta.label_lower}:{field}:{value}"
+
+    def get_cached_queryset(self, field, value):
+        return self.get_queryset().filter(**{field: value})
+
+    def get_cached_pk(self, **lookup):
+        """
+        Function to return the primary key of the object matching the lookup, or None
+        """
+        ((field, value),) = lookup.items()
+        if field not in self.cached_lookup_fields:
+            raise ValueError(f"{field} is not a cached lookup field of {self.model.__name__}")
+
+        return tiered_cache.get_or_set(
+            self.cached_lookup_key(field, value),
+            lambda: self.get_cached_queryset(field, value).values_list("pk", flat=True).first(),
+            self.cached_lookup_timeout,
+            cache_none=False,
+        )
+
+    def exists_cached(self, **lookup) -> bool:
+        return self.get_cached_pk(**lookup) is not None
+
+    def get_cached(self, **lookup):
+        """
+        Function to fetch the object matching the lookup by its cached primary key
+        """
+        ((field, value),) = lookup.items()
+        pk = self.get_cached_pk(**lookup)
+        instance = None if pk is None else self.get_cached_queryset(field, value).filter(pk=pk).first()
+        if instance is None and pk is not None:
+            # the cached key is stale, e.g. the email moved to another user
+            tiered_cache.delete(self.cached_lookup_key(field, value))
+            instance = self.get_cached_queryset(field, value).first()
+        if instance is None:
+            raise self.model.DoesNotExist(f"{self.model.__name__} matching query does not exist.")
+
+        return instance
+
+    def invalidate_cached(self, instance) -> None:
+        for field in self.cached_lookup_fields:
+            tiered_cache.delete(self.cached_lookup_key(field, getattr(instance, field)))
+
+
+class OutgoingEmailManager(models.Manager):
+    """Model manager for the Outgoing Email Model"""
+
+    def enqueue(self, subject, body, to, from_email=None, html_body=None, attachments=None):
+        """
+        Function to queue an email for delivery by the `send_queued_emails` command.
+        Only inserts a row, so it joins the caller's transaction.
+        """
+        if isinstance(to, str):
+            to = [to]
+
+        return self.create(
+            subject=subject,
+            body=body,
+            to=list(to),
+            from_email=from_email,
+            html_body=html_body,
+            attachments=[str(path) for path in attachments or []],
+        )
+
+    def due(self):
+        """
+        Function to return pending emails whose next attempt is due, and emails claimed by
+        a worker whose lease expired, oldest first.
+        """
+        return self.filter(status__in=["PENDING", "SENDING"], next_attempt_at__lte=timezone.now()).order_by("pk")
@@ -0,0 +1,271 @@
+"""
+This file contains the per-request timings recorded by `config.middleware.timing` and the
+histogram store behind the Prometheus `/metrics` endpoint.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+
+from django.conf import settings
+
+from .cache import tiered_cache
+from .database import pool_stats
+
+
+# Upper bounds in seconds of the histogram buckets, +Inf is implied
+buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_request_timings = ContextVar("request_timings", default=None)
+
+
+class RequestTimings:
+    """Seconds spent in each phase of the current request, and its number of DB queries"""
+
+    def __init__(self):
+        self.phases = {}
+        self.db_queries = 0
+
+    def add(self, phase, seconds) -> None:
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+
+def start_request_timings():
+    """
+    Function to give the current request its own timings, returns the token to reset them with
+    """
+    return _request_timings.set(RequestTimings())
+
+
+def reset_request_timings(token) -> None:
+    _request_timings.reset(token)
+
+
+def get_request_timings():
+    return _request_timings.get()
+
+
+@contextmanager
+def timed(phase):
+    """
+    Context manager adding the time spent in the block to a phase of the current request
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.add(phase, time.perf_counter() - start)
+
+
+def db_execute_wrapper(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting the queries of the current request and their time
+    """
+    timings = _request_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.add("db", time.perf_counter() - start)
+        timings.db_queries += 1
+
+
+def _is_running(pid) -> bool:
+    """
+    Function to check whether the worker with this pid is still running
+    """
+    try:
+        os.kill(int(pid), 0)
+    except ValueError:
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # running as another user
+        return True
+
+    return True
+
+
+def _empty_histogram() -> dict:
+    # one count per bucket, the last one for +Inf
+    return {"buckets": [0] * (len(buckets) + 1), "sum": 0.0, "count": 0}
+
+
+class HistogramStore:
+    """
+    Per-view histograms of request phase timings. Each worker process keeps its own counts
+    and, when `METRICS_DIR` is set, writes them to `<pid>.json` in that directory at most every
+    `METRICS_FLUSH_SECONDS`, so any worker can serve the sum of all workers without shared memory.
+    The files of exited workers are removed when the metrics are collected, clear the directory
+    when the server starts.
+
+    Snapshots also carry the tiered cache counters and the connection pool statistics of the worker.
+    """
+
+    def __init__(self):
+        self._histograms = {}
+        self._queries = {}
+        self._lock = threading.Lock()
+        self._flushed_at = 0.0
+
+    @property
+    def directory(self):
+        directory = getattr(settings, "METRICS_DIR", "")
+        return Path(directory) if directory else None
+
+    def observe(self, view, method, timings) -> None:
+        with self._lock:
+            for phase, seconds in timings.phases.items():
+                key = f"{view}|{method}|{phase}"
+                histogram = self._histograms.setdefault(key, _empty_histogram())
+
+                index = next((i for i, bound in enumerate(buckets) if seconds <= bound), len(buckets))
+                histogram["buckets"][index] += 1
+                histogram["sum"] += seconds
+                histogram["count"] += 1
+
+            key = f"{view}|{method}"
+            self._queries[key] = self._queries.get(key, 0) + timings.db_queries
+
+        if time.monotonic() - self._flushed_at >= getattr(settings, "METRICS_FLUSH_SECONDS", 1):
+            self.flush()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            histograms = {key: {**value, "buckets": value["buckets"][:]} for key, value in self._histograms.items()}
+            queries = dict(self._queries)
+
+        pools = {
+            alias: {name: value for name, value in stats.items() if name != "saturation"}
+            for alias, stats in pool_stats().items()
+        }
+        return {"histograms": histograms, "queries": queries, "cache": tiered_cache.stats(), "pools": pools}
+
+    def flush(self) -> None:
+        self._flushed_at = time.monotonic()
+        directory = self.directory
+        if directory is None:
+            return
+
+        directory.mkdir(parents=True, exist_ok=True)
+        # write then rename, readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as file:
+            json.dump(self.snapshot(), file)
+        os.replace(tmp_path, directory / f"{os.getpid()}.json")
+
+    def collect(self) -> dict:
+        """
+        Function to return the histograms and query counts summed over every worker
+        """
+        directory = self.directory
+        if directory is None:
+            return self.snapshot()
+
+        self.flush()
+        merged = {"histograms": {}, "queries": {}, "cache": {}, "pools": {}}
+        for path in directory.glob("*.json"):
+            if not _is_running(path.stem):
+                path.unlink(missing_ok=True)
+                continue
+            try:
+                data = json.loads(path.read_text())
+            except (OSError, ValueError):
+                continue
+
+            for key, value in data["histograms"].items():
+                histogram = merged["histograms"].setdefault(key, _empty_histogram())
+                histogram["buckets"] = [a + b for a, b in zip(histogram["buckets"], value["buckets"])]
+                histogram["sum"] += value["sum"]
+                histogram["count"] += value["count"]
+            for key, value in data["queries"].items():
+                merged["queries"][key] = merged["queries"].get(key, 0) + value
+            for key, value in data.get("cache", {}).items():
+                merged["cache"][key] = merged["cache"].get(key, 0) + value
+            for alias, stats in data.get("pools", {}).items():
+                pool = merged["pools"].setdefault(alias, {})
+                for key, value in stats.items():
+                    pool[key] = pool.get(key, 0) + value
+
+        return merged
+
+
+histogram_store = HistogramStore()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def render_metrics() -> str:
+    """
+    Function to render the collected metrics in the Prometheus text exposition format
+    """
+    data = histogram_store.collect()
+    lines = [
+        "# HELP http_request_phase_seconds Time spent in each phase of a request: total, db, envelope and render.",
+        "# TYPE http_request_phase_seconds histogram",
+    ]
+    for key, histogram in sorted(data["histograms"].items()):
+        view, method, phase = key.split("|")
+        cumulative = 0
+        for bound, count in zip([*map(repr, buckets), "+Inf"], histogram["buckets"]):
+            cumulative += count
+            bucket_labels = _labels(view=view, method=method, phase=phase, le=bound)
+            lines.append(f"http_request_phase_seconds_bucket{bucket_labels} {cumulative}")
+        labels = _labels(view=view, method=method, phase=phase)
+        lines.append(f"http_request_phase_seconds_sum{labels} {histogram['sum']}")
+        lines.append(f"http_request_phase_seconds_count{labels} {histogram['count']}")
+
+    lines += [
+        "# HELP http_request_db_queries_total Database queries run by requests.",
+        "# TYPE http_request_db_queries_total counter",
+    ]
+    for key, count in sorted(data["queries"].items()):
+        view, method = key.split("|")
+        lines.append(f"http_request_db_queries_total{_labels(view=view, method=method)} {count}")
+
+    cache_stats = dict(data["cache"])
+    lines += [
+        "# HELP tiered_cache_local_size Keys held in the in-process tier of the tiered cache.",
+        "# TYPE tiered_cache_local_size gauge",
+        f"tiered_cache_local_size {cache_stats.pop('local_size', 0)}",
+        "# HELP tiered_cache_events_total Tiered cache hits per tier, misses, loads and local evictions.",
+        "# TYPE tiered_cache_events_total counter",
+    ]
+    for event, count in sorted(cache_stats.items()):
+        lines.append(f"tiered_cache_events_total{_labels(event=event)} {count}")
+
+    if data["pools"]:
+        lines += [
+            "# HELP database_pool_stat Connection pool statistics of psycopg_pool, summed over workers.",
+            "# TYPE database_pool_stat gauge",
+        ]
+        for alias, stats in sorted(data["pools"].items()):
+            for name, value in sorted(stats.items()):
+                lines.append(f"database_pool_stat{_labels(alias=alias, stat=name)} {value}")
+        lines += [
+            "# HELP database_pool_saturation Share of the pool maximum checked out, over all workers.",
+            "# TYPE database_pool_saturation gauge",
+        ]
+        for alias, stats in sorted(data["pools"].items()):
+            in_use = stats.get("pool_size", 0) - stats.get("pool_available", 0)
+            saturation = in_use / stats["pool_max"] if stats.get("pool_max") else 0.0
+            lines.append(f"database_pool_saturation{_labels(alias=alias)} {saturation}")
+
+    return "\n".join(lines) + "\n"
@@ -1,9 +1,15 @@
 import uuid
+import hmac
+import base64
+import hashlib
 import pyotp
-from django.db import models
+from django.conf import settings
+from django.db import models, router
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from .constants import otp_purpose
+from .expressions import JSONKeySet
+from .managers import OutgoingEmailManager
 
 
 class UUIDModel(models.Model):
@@ -31,6 +37,10 @@ class OTPSecretModel(models.Model):
     """
     An abstract base class for generating OTP secret keys for
     generating OTPs for the User Model.
+
+    With `OTP_SECRET_MODE = "derived"` nothing is stored, each secret key is derived
+    with HMAC from `OTP_MASTER_KEY`, the `id` of the instance and the rotation counter
+    of the purpose in `OTP_SECRET_ROTATIONS`. Bump the counter to rotate a purpose.
     """
 
     keys = otp_purpose
@@ -39,11 +49,64 @@ class OTPSecretModel(models.Model):
     class Meta:
         abstract = True
 
+    @staticmethod
+    def uses_derived_sk() -> bool:
+        return getattr(settings, "OTP_SECRET_MODE", "stored") == "derived"
+
+    def derive_sk(self, purpose: str) -> str:
+        """
+        Function to derive the secret key of a purpose from the master key.
+        """
+        rotation = getattr(settings, "OTP_SECRET_ROTATIONS", {}).get(purpose, 0)
+        master_key = getattr(settings, "OTP_MASTER_KEY", None) or settings.SECRET_KEY
+        message = f"{self.id}:{purpose}:{rotation}".encode("utf-8")
+        digest = hmac.new(master_key.encode("utf-8"), message, hashlib.sha256).digest()
+
+        return base64.b32encode(digest[:20]).decode("ascii")
+
+    def get_sk(self, purpose: str) -> str:
+        """
+        Function to return the secret key of a purpose, creating it if missing.
+        """
+        if self.uses_derived_sk():
+            return self.derive_sk(purpose)
+
+        if purpose not in self.secret_keys:
+            self.ensure_sk(purpose)
+
+        return self.secret_keys[purpose]
+
+    def get_write_db(self) -> str:
+        return router.db_for_write(type(self), instance=self)
+
+    def _update_sk(self, value) -> None:
+        """
+        Function to update only the `secret_keys` column of this row in the database.
+        """
+        type(self)._base_manager.using(self.get_write_db()).filter(pk=self.pk).update(secret_keys=value)
+
+    def ensure_sk(self, purpose: str) -> dict:
+        """
+        Function to add a secret key for a purpose unless the database already has one,
+        in a single UPDATE so concurrent requests agree on the same key.
+        """
+        if not self.pk:
+            self.secret_keys.setdefault(purpose, pyotp.random_base32())
+            return self.secret_keys
+
+        self._update_sk(JSONKeySet("secret_keys", purpose, pyotp.random_base32(), only_if_absent=True))
+        self.refresh_from_db(using=self.get_write_db(), fields=["secret_keys"])
+
+        return self.secret_keys
+
     def initiate_all_sk(self) -> dict:
         """
         Function to generate all secret keys on User Model for OTP generation,
         to be invoked on user creation.
         """
+        if self.uses_derived_sk():
+            return {}
+
         new_keys = {}
         for purpose in self.keys:
             otp_secret = pyotp.random_base32()
@@ -62,17 +125,24 @@ class OTPSecretModel(models.Model):
             new_keys[purpose] = otp_secret
 
         self.secret_keys = new_keys
-        self.save()
+        if self.pk:
+            self._update_sk(new_keys)
+        else:
+            self.save()
 
         return self.secret_keys
 
     def modify_sk(self, purpose: str) -> dict:
         """
         Function to add or edit a secret key on User Model for OTP generation.
+        Only this key is written, other keys changed concurrently are kept.
         """
         otp_secret = pyotp.random_base32()
         self.secret_keys[purpose] = otp_secret
-        self.save()
+        if self.pk:
+            self._update_sk(JSONKeySet("secret_keys", purpose, otp_secret))
+        else:
+            self.save()
 
         return self.secret_keys
 
@@ -81,6 +151,47 @@ class OTPSecretModel(models.Model):
         Function to remove all secret keys on User Model for OTP generation.
         """
         self.secret_keys = {}
-        self.save()
+        if self.pk:
+            self._update_sk({})
+        else:
+            self.save()
 
         return self.secret_keys
+
+
+class OutgoingEmail(TimeStampedModel):
+    """
+    A class implementing the email outbox. Emails are inserted in the request
+    transaction and delivered later by the `send_queued_emails` command.
+    """
+
+    # Choices
+    status_choices = (
+        ("PENDING", "PENDING"),
+        ("SENDING", "SENDING"),
+        ("SENT", "SENT"),
+        ("FAILED", "FAILED"),
+    )
+
+    subject = models.CharField(_("subject"), max_length=255)
+    body = models.TextField(_("body"), blank=True)
+    html_body = models.TextField(_("html body"), blank=True, null=True)
+    from_email = models.CharField(_("from email"), max_length=255, blank=True, null=True)
+    to = models.JSONField(_("recipients"), default=list)
+    attachments = models.JSONField(_("attachment paths"), default=list, blank=True)
+    status = models.CharField(_("status"), max_length=10, choices=status_choices, default="PENDING")
+    attempts = models.PositiveSmallIntegerField(_("attempts"), default=0)
+    next_attempt_at = models.DateTimeField(_("next attempt at"), default=timezone.now)
+    last_error = models.TextField(_("last error"), blank=True, null=True)
+    date_sent = models.DateTimeField(_("date sent"), blank=True, null=True)
+
+    objects = OutgoingEmailManager()
+
+    class Meta:
+        verbose_name = _("Outgoing Email")
+        verbose_name_plural = _("Outgoing Emails")
+        ordering = ["-date_created"]
+        indexes = [models.Index(fields=["status", "next_attempt_at"], name="outbox_pending_idx")]
+
+    def __str__(self) -> str:
+        return f"{self.subject} ({self.status})"
@@ -4,25 +4,222 @@ This file contains a paginator class used for the entire project
 
 from __future__ import unicode_literals
 
+import json
+import hashlib
+from itertools import islice
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from collections import OrderedDict
 
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet
+from django.core.handlers.asgi import ASGIRequest
+from django.core.paginator import InvalidPage, Paginator as DjangoPaginator
+from django.db import connections
+from django.db.models import Q
+from django.http import StreamingHttpResponse
+from django.utils.functional import cached_property
+from django.utils.dateparse import parse_datetime
 from django.utils.translation import gettext_lazy as _
 
 from rest_framework import status
+from rest_framework.exceptions import NotFound, ParseError
 from rest_framework.response import Response
 from rest_framework.pagination import PageNumberPagination, LimitOffsetPagination
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from .encoders import json_dumps
+from .renderers import FastJSONRenderer
+
+
+def exact_count(queryset):
+    """
+    Function to count the rows of the queryset with `SELECT COUNT(*)`
+    """
+    return queryset.count(), "exact"
+
+
+def cached_count(queryset):
+    """
+    Function to return the exact count of the queryset, cached for `PAGINATION_COUNT_CACHE_TIMEOUT`
+    seconds under a key derived from the queryset SQL without its ordering.
+    """
+    try:
+        sql, params = queryset.order_by().query.sql_with_params()
+    except EmptyResultSet:
+        return 0, "exact"
+
+    key = "%s%s" % (sql, params)
+    cache_key = "paginator:count:%s:%s" % (queryset.db, hashlib.md5(key.encode("utf-8")).hexdigest())
+    count = cache.get(cache_key)
+    if count is None:
+        count = queryset.count()
+        cache.set(cache_key, count, getattr(settings, "PAGINATION_COUNT_CACHE_TIMEOUT", 60))
+        return count, "exact"
+
+    return count, "cached"
+
+
+def estimated_count(queryset):
+    """
+    Function to return the planner estimate of the table size for unfiltered querysets on PostgreSQL.
+    Filtered querysets, small tables and other databases fall back to the cached count.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql" or queryset.query.where:
+        return cached_count(queryset)
+
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [queryset.model._meta.db_table])
+        row = cursor.fetchone()
+
+    estimate = int(row[0]) if row else -1
+    if estimate < getattr(settings, "PAGINATION_COUNT_ESTIMATE_THRESHOLD", 100000):
+        return cached_count(queryset)
+
+    return estimate, "estimated"
+
+
+count_strategies = {
+    "exact": exact_count,
+    "cached": cached_count,
+    "estimated": estimated_count,
+}
+
+
+class CountStrategyPaginator(DjangoPaginator):
+    """
+    Django paginator computing `count` with the strategy named by `PAGINATION_COUNT_STRATEGY`
+    (exact, cached or estimated, cached by default). The kind of count used is stored in `count_type`.
+    """
+
+    count_type = "exact"
+
+    @cached_property
+    def count(self):
+        strategy = count_strategies[getattr(settings, "PAGINATION_COUNT_STRATEGY", "cached")]
+        if not hasattr(self.object_list, "query"):
+            return len(self.object_list)
+
+        count, self.count_type = strategy(self.object_list)
+        return count
 
 
 class RestPagination(PageNumberPagination, LimitOffsetPagination):
+    """
+    Paginator supporting page number and limit pagination. Sending the `cursor` query
+    parameter (empty for the first page) switches to keyset pagination over
+    (`date_created`, `pk`), which does not slow down on deep pages like `OFFSET` does.
+
+    The `limit` query parameter is capped at `PAGINATION_MAX_PAGE_SIZE`. Pages larger than
+    `PAGINATION_STREAM_THRESHOLD` are returned as a lazy queryset, streamed with
+    `get_streaming_response` when the client negotiated JSON, see `StreamingListMixin`.
+    """
+
+    django_paginator_class = CountStrategyPaginator
+    cursor_query_param = "cursor"
+    invalid_cursor_message = _("Invalid cursor")
 
     def paginate_queryset(self, queryset, request, view=None):
         limit = request.query_params.get("limit")
-        if str(limit).isdigit():
-            self.page_size = int(limit)
+        if str(limit).isdigit() and int(limit) > 0:
+            self.page_size = min(int(limit), getattr(settings, "PAGINATION_MAX_PAGE_SIZE", 1000))
+
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if self.cursor_mode:
+            return self.paginate_queryset_by_cursor(queryset, request)
+
+        self.streaming = hasattr(queryset, "iterator") and self.page_size > getattr(
+            settings, "PAGINATION_STREAM_THRESHOLD", 200
+        )
+        if self.streaming:
+            return self.paginate_queryset_lazily(queryset, request)
+
         return super().paginate_queryset(queryset, request, view=view)
 
+    def paginate_queryset_lazily(self, queryset, request):
+        """
+        Function to return the requested page as an unevaluated queryset slice
+        so rows can be streamed instead of loaded into memory at once.
+        """
+        paginator = self.django_paginator_class(queryset, self.page_size)
+        page_number = self.get_page_number(request, paginator)
+
+        try:
+            self.page = paginator.page(page_number)
+        except InvalidPage as exc:
+            msg = self.invalid_page_message.format(page_number=page_number, message=str(exc))
+            raise NotFound(msg)
+
+        self.request = request
+        return self.page.object_list
+
+    def encode_cursor(self, instance, reverse=False):
+        position = {"d": instance.date_created.isoformat(), "p": instance.pk, "r": reverse}
+        return urlsafe_b64encode(json.dumps(position).encode("ascii")).decode("ascii")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, None, False
+
+        try:
+            position = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            date_created = parse_datetime(position["d"])
+            pk = int(position["p"])
+            # a pk outside the bigint range would overflow in the database instead
+            if date_created is None or not -(2**63) <= pk < 2**63:
+                raise ValueError
+            return date_created, pk, bool(position["r"])
+        except (TypeError, ValueError, KeyError):
+            raise ParseError(self.invalid_cursor_message)
+
+    def paginate_queryset_by_cursor(self, queryset, request):
+        """
+        Function to return a page of the queryset positioned after (or before when
+        paging backwards) the row encoded in the cursor, newest rows first.
+        """
+        self.request = request
+        date_created, pk, reverse = self.decode_cursor(request)
+
+        if date_created is not None:
+            if reverse:
+                queryset = queryset.filter(Q(date_created__gt=date_created) | Q(date_created=date_created, pk__gt=pk))
+            else:
+                queryset = queryset.filter(Q(date_created__lt=date_created) | Q(date_created=date_created, pk__lt=pk))
+
+        if reverse:
+            queryset = queryset.order_by("date_created", "pk")
+        else:
+            queryset = queryset.order_by("-date_created", "-pk")
+
+        # fetch one extra row to know whether there is a page beyond this one
+        results = list(queryset[: self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[: self.page_size]
+
+        if reverse:
+            results.reverse()
+            has_next, has_previous = date_created is not None, has_more
+        else:
+            has_next, has_previous = has_more, date_created is not None
+
+        self.next_cursor = self.encode_cursor(results[-1]) if results and has_next else None
+        self.previous_cursor = self.encode_cursor(results[0], reverse=True) if results and has_previous else None
+
+        return results
+
+    def get_cursor_link(self, cursor):
+        if cursor is None:
+            return None
+        url = remove_query_param(self.request.build_absolute_uri(), self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
     def get_paginated_response(self, results):
+        if self.cursor_mode:
+            return self.get_cursor_paginated_response(results)
+
         next_link = self.get_next_link() or ""
         prev_link = self.get_previous_link() or ""
 
@@ -34,6 +231,7 @@ class RestPagination(PageNumberPagination, LimitOffsetPagination):
             OrderedDict(
                 [
                     ("count", self.page.paginator.count),
+                    ("count_type", self.page.paginator.count_type),
                     ("page_size", self.page_size),
                     ("current_page", self.page.number),
                     ("next", next_link or None),
@@ -45,3 +243,112 @@ class RestPagination(PageNumberPagination, LimitOffsetPagination):
                 ]
             )
         )
+
+    def get_cursor_paginated_response(self, results):
+        next_link = self.get_cursor_link(self.next_cursor) or ""
+        prev_link = self.get_cursor_link(self.previous_cursor) or ""
+
+        if getattr(settings, "USE_SSL", False):
+            next_link = next_link.replace("http:", "https:")
+            prev_link = prev_link.replace("http:", "https:")
+
+        return Response(
+            OrderedDict(
+                [
+                    ("page_size", self.page_size),
+                    ("next", next_link or None),
+                    ("previous", prev_link or None),
+                    ("status", status.HTTP_200_OK),
+                    ("message", _("Success")),
+                    ("success", True),
+                    ("results", results),
+                ]
+            )
+        )
+
+    def can_stream(self, request) -> bool:
+        """
+        Function to check whether the negotiated renderer can be streamed, only JSON written
+        by `FastJSONRenderer` without indentation is, other renderers render the page at once
+        """
+        renderer = getattr(request, "accepted_renderer", None)
+        if not isinstance(renderer, FastJSONRenderer):
+            return False
+
+        return not renderer.get_indent(request.accepted_media_type or "", {})
+
+    def get_streaming_response(self, page, get_serializer):
+        """
+        Function to write the paginated envelope incrementally, serializing the rows
+        of the page `PAGINATION_STREAM_CHUNK_SIZE` at a time. Under ASGI the chunks are
+        produced by an async iterator, Django would otherwise load a sync one into memory.
+        """
+        next_link = self.get_next_link() or ""
+        prev_link = self.get_previous_link() or ""
+
+        if getattr(settings, "USE_SSL", False):
+            next_link = next_link.replace("http:", "https:")
+            prev_link = prev_link.replace("http:", "https:")
+
+        envelope = OrderedDict(
+            [
+                ("count", self.page.paginator.count),
+                ("count_type", self.page.paginator.count_type),
+                ("page_size", self.page_size),
+                ("current_page", self.page.number),
+                ("next", next_link or None),
+                ("previous", prev_link or None),
+                ("status", status.HTTP_200_OK),
+                ("message", _("Success")),
+                ("success", True),
+            ]
+        )
+        chunk_size = getattr(settings, "PAGINATION_STREAM_CHUNK_SIZE", 100)
+
+        def stream():
+            yield json_dumps(envelope)[:-1] + b',"results":['
+
+            rows = page.iterator(chunk_size=chunk_size)
+            separator = b""
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+                yield separator + b",".join(json_dumps(item) for item in get_serializer(chunk, many=True).data)
+                separator = b","
+
+            yield b"]}"
+
+        async def astream():
+            # the rows are fetched on the request's sync thread, which holds its connection
+            chunks = stream()
+            next_chunk = sync_to_async(next, thread_sensitive=True)
+            while (chunk := await next_chunk(chunks, None)) is not None:
+                yield chunk
+
+        content = astream() if isinstance(self.request._request, ASGIRequest) else stream()
+        return StreamingHttpResponse(content, content_type=FastJSONRenderer.media_type)
+
+
+class StreamingListMixin:
+    """
+    Mixin for list views paginated with `RestPagination` that streams JSON pages
+    larger than `PAGINATION_STREAM_THRESHOLD` instead of rendering them at once.
+    Pages negotiated with another renderer, e.g. MessagePack or the browsable API,
+    are rendered as usual. The streamed body is the envelope `get_paginated_response`
+    returns, so `Use-Default-Response` gets the same content either way.
+    """
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            if getattr(self.paginator, "streaming", False) and self.paginator.can_stream(request):
+                return self.paginator.get_streaming_response(page, self.get_serializer)
+
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        serializer = self.get_serializer(queryset, many=True)
+        return Response(serializer.data)
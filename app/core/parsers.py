@@ -0,0 +1,22 @@
+"""
+This file contains custom parsers for request bodies of APIs in this project
+"""
+
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+from .encoders import msgpack_loads
+
+
+class MessagePackParser(parsers.BaseParser):
+    """
+    Parser for MessagePack request bodies sent with `Content-Type: application/msgpack`.
+    Requires the optional msgpack package.
+    """
+
+    media_type = "application/msgpack"
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack_loads(stream.read())
+        except Exception as exc:
+            raise ParseError("MessagePack parse error - %s" % str(exc))
@@ -14,7 +14,7 @@ class IsFullyGrantedPermission(BasePermission):
 
     def has_permission(self, request, view):
         if request.user and request.user.is_authenticated:
-            if request.user.profile.is_confirmed:
+            if request.user.is_profile_confirmed:
                 return True
             return False
 
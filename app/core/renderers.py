@@ -3,7 +3,56 @@ This file contains custom renderers for format of responses of APIs in this proj
 """
 
 from rest_framework import renderers
-import json
+from rest_framework.exceptions import ErrorDetail
+from .encoders import json_dumps, msgpack_dumps
+
+
+def has_error_detail(data) -> bool:
+    """
+    Function to check if the data contains an `ErrorDetail` at any depth
+    """
+    if isinstance(data, ErrorDetail):
+        return True
+    if isinstance(data, dict):
+        return any(has_error_detail(value) for value in data.values())
+    if isinstance(data, (list, tuple)):
+        return any(has_error_detail(value) for value in data)
+
+    return False
+
+
+class FastJSONRenderer(renderers.JSONRenderer):
+    """
+    JSON renderer encoding with the project JSON backend, orjson when installed.
+    Indented output requested by the client is left to the default renderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        if self.get_indent(accepted_media_type or "", renderer_context or {}):
+            return super().render(data, accepted_media_type=accepted_media_type, renderer_context=renderer_context)
+
+        return json_dumps(data)
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    Renderer producing MessagePack, selected when the client sends `Accept: application/msgpack`.
+    Requires the optional msgpack package.
+    """
+
+    media_type = "application/msgpack"
+    format = "msgpack"
+    charset = None
+    render_style = "binary"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b""
+
+        return msgpack_dumps(data)
 
 
 class DefaultRenderer(renderers.JSONRenderer):
@@ -13,8 +62,8 @@ class DefaultRenderer(renderers.JSONRenderer):
         if not renderer_context["response"].exception:
             response = ""
 
-            if "ErrorDetail" in str(data):
-                response = json.dumps(
+            if has_error_detail(data):
+                response = json_dumps(
                     {
                         "success": True,
                         "status_code": renderer_context["response"].status_code,
@@ -23,7 +72,7 @@ class DefaultRenderer(renderers.JSONRenderer):
                     }
                 )
             else:
-                response = json.dumps(
+                response = json_dumps(
                     {
                         "success": True,
                         "status_code": renderer_context["response"].status_code,
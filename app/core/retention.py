@@ -0,0 +1,86 @@
+"""
+This file contains the retention policies used to purge stale rows from the largest tables
+"""
+
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.timezone import timedelta
+
+
+class RetentionPolicy:
+    """
+    A class describing the rows of a model that can be deleted.
+    `get_filter` returns the Q object matching expired rows and `get_databases`
+    the aliases the rows are spread over, None standing for the routed database.
+    """
+
+    def __init__(self, name, model_label, get_filter, get_databases=None):
+        self.name = name
+        self.model_label = model_label
+        self.get_filter = get_filter
+        self.get_databases = get_databases or (lambda: [None])
+
+    def get_queryset(self, using=None):
+        model = apps.get_model(self.model_label)
+        return model._default_manager.using(using).filter(self.get_filter()).order_by()
+
+    def purge(self, batch_size=None, sleep=None, stdout=None, using=None):
+        """
+        Function to delete the expired rows in small primary key ranges, sleeping between
+        batches so locks are held briefly. Returns the number of rows deleted.
+        """
+        batch_size = batch_size or getattr(settings, "RETENTION_BATCH_SIZE", 500)
+        sleep = getattr(settings, "RETENTION_BATCH_SLEEP", 0.1) if sleep is None else sleep
+        queryset = self.get_queryset(using)
+        model = queryset.model
+        deleted = 0
+        last_pk = None
+
+        while True:
+            batch = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            pks = list(batch.order_by("pk").values_list("pk", flat=True)[:batch_size])
+            if not pks:
+                break
+
+            _, per_model = queryset.filter(pk__gte=pks[0], pk__lte=pks[-1]).delete()
+            deleted += per_model.get(model._meta.label, 0)
+            last_pk = pks[-1]
+
+            if stdout is not None:
+                stdout.write(f"{self.name}: deleted {deleted} row(s) up to pk {last_pk}")
+            if len(pks) < batch_size:
+                break
+            time.sleep(sleep)
+
+        return deleted
+
+    def backlog(self, using=None) -> int:
+        return self.get_queryset(using).count()
+
+
+def _otp_filter():
+    # codes expire after `otp_interval` seconds, any code older than the retention period is spent
+    return Q(date_created__lt=timezone.now() - timedelta(days=getattr(settings, "RETENTION_OTP_DAYS", 7)))
+
+
+def _outstanding_token_filter():
+    grace = timedelta(days=getattr(settings, "RETENTION_TOKEN_GRACE_DAYS", 0))
+    return Q(expires_at__lt=timezone.now() - grace)
+
+
+def _user_databases():
+    # OTPs and tokens are stored with their user, on every shard when users are sharded
+    return list(getattr(settings, "USER_SHARDS", [])) or [None]
+
+
+# Blacklisted tokens are removed with their outstanding token through the cascade
+retention_policies = {
+    "otp": RetentionPolicy("otp", "user.UserOTP", _otp_filter, _user_databases),
+    "tokens": RetentionPolicy(
+        "tokens", "token_blacklist.OutstandingToken", _outstanding_token_filter, _user_databases
+    ),
+}
@@ -0,0 +1,39 @@
+"""
+This file contains serializer helpers used throughout the project
+"""
+
+from django.core.exceptions import ValidationError as DjangoValidationError
+from rest_framework.exceptions import ValidationError
+from rest_framework.serializers import as_serializer_error
+
+
+class AsyncValidationMixin:
+    """
+    Serializer mixin adding `ais_valid`, which runs the field validation like `is_valid`
+    and then awaits `avalidate` in place of `validate`. Field validators must not query
+    the database, database checks belong in `avalidate`.
+    """
+
+    async def avalidate(self, attrs):
+        return attrs
+
+    async def ais_valid(self, raise_exception=False):
+        if not hasattr(self, "_validated_data"):
+            try:
+                value = self.to_internal_value(self.initial_data)
+                try:
+                    self.run_validators(value)
+                    value = await self.avalidate(value)
+                except (ValidationError, DjangoValidationError) as exc:
+                    raise ValidationError(detail=as_serializer_error(exc))
+            except ValidationError as exc:
+                self._validated_data = {}
+                self._errors = exc.detail
+            else:
+                self._validated_data = value
+                self._errors = {}
+
+        if self._errors and raise_exception:
+            raise ValidationError(self.errors)
+
+        return not bool(self._errors)
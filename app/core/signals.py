@@ -0,0 +1,15 @@
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .metrics import db_execute_wrapper
+
+
+@receiver(connection_created)
+def install_query_timing(sender, connection, **kwargs):
+    """
+    Signal to install the query timing wrapper once on every database connection. It records
+    the queries of the request whose timings are in the current context, so queries run on
+    `sync_to_async` threads under ASGI are counted as well.
+    """
+    if db_execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(db_execute_wrapper)
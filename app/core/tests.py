@@ -1,3 +1,669 @@
-from django.test import TestCase
+import json
+import multiprocessing
+import os
+import tempfile
+import threading
+import uuid
+from base64 import urlsafe_b64encode
+from datetime import datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import StringIO
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock, skipIf
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework import generics, renderers, serializers
+from rest_framework.exceptions import ErrorDetail, NotFound
+from rest_framework.response import Response
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from app.user.models import User, UserOTP
+from config.middleware.replica import ReplicaPinMiddleware
+from config.middleware.response import BaseAPIResponseMiddleware
+from config.middleware.timing import RequestTimingMiddleware
+from config.routers import use_primary
+from .cache import TieredCache
+from .encoders import json_dumps, msgpack, msgpack_dumps, msgpack_loads
+from .metrics import db_execute_wrapper, get_request_timings, histogram_store, render_metrics, start_request_timings
+from .models import OutgoingEmail
+from .renderers import FastJSONRenderer, MessagePackRenderer, has_error_detail
+from .paginator import CountStrategyPaginator, StreamingListMixin
+from .views import AsyncGenericAPIView, metrics
+
+
+class UserEmailSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = User
+        fields = ["email"]
+
+
+class StreamingUserListView(StreamingListMixin, generics.ListAPIView):
+    authentication_classes = []
+    permission_classes = []
+    serializer_class = UserEmailSerializer
+
+    def get_queryset(self):
+        return User.objects.order_by("email")
+
+
+class EchoView(generics.GenericAPIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def post(self, request):
+        return Response({"echo": request.data})
+
+
+class EnvelopeSuccessView(generics.GenericAPIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        return Response({"message": "Created", "result": {"email": "envelope@example.com", "score": 1.5}}, status=201)
+
+
+class EnvelopeErrorView(generics.GenericAPIView):
+    authentication_classes = []
+    permission_classes = []
+
+    def get(self, request):
+        if request.query_params.get("detail"):
+            raise NotFound()
+        raise serializers.ValidationError(
+            {"email": ["This field is required."], "non_field_errors": ["Passwords didn't match."]}
+        )
+
+
+class AsyncMessageView(AsyncGenericAPIView):
+    authentication_classes = []
+    permission_classes = []
+
+    async def get(self, request):
+        return Response({"message": "pong"})
+
+
+class AsyncCountView(AsyncGenericAPIView):
+    authentication_classes = []
+    permission_classes = []
+
+    async def get(self, request):
+        return Response({"count": await User.objects.acount()})
+
+
+urlpatterns = [
+    path("async/", AsyncMessageView.as_view()),
+    path("async/count/", AsyncCountView.as_view()),
+    path("users/", StreamingUserListView.as_view()),
+    path("envelope/success/", EnvelopeSuccessView.as_view()),
+    path("envelope/error/", EnvelopeErrorView.as_view()),
+]
+
+
+class CountStrategyPaginatorTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        User.objects.create_user(email="first@example.com", password="a-long-password")
+        User.objects.create_user(email="second@example.com", password="a-long-password")
+
+    def test_counts_are_cached_by_default(self):
+        first = CountStrategyPaginator(User.objects.all(), 1)
+        self.assertEqual(first.count, 2)
+        self.assertEqual(first.count_type, "exact")
+
+        second = CountStrategyPaginator(User.objects.all(), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(second.count, 2)
+        self.assertEqual(second.count_type, "cached")
+
+    @override_settings(PAGINATION_COUNT_STRATEGY="exact")
+    def test_exact_strategy_counts_every_time(self):
+        CountStrategyPaginator(User.objects.all(), 1).count
+        paginator = CountStrategyPaginator(User.objects.all(), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(paginator.count, 2)
+        self.assertEqual(paginator.count_type, "exact")
+
+
+@override_settings(PAGINATION_STREAM_THRESHOLD=2, PAGINATION_STREAM_CHUNK_SIZE=2)
+class StreamingListMixinTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for index in range(5):
+            User.objects.create_user(email=f"user{index}@example.com", password="a-long-password")
+
+    def get(self, **headers):
+        request = APIRequestFactory().get("/users/", {"limit": 4}, **headers)
+        return StreamingUserListView.as_view()(request)
+
+    def test_json_pages_are_streamed(self):
+        response = self.get(HTTP_ACCEPT="application/json")
+
+        self.assertIsInstance(response, StreamingHttpResponse)
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([row["email"] for row in data["results"]], [f"user{index}@example.com" for index in range(4)])
+        self.assertEqual(data["count"], 5)
+        self.assertTrue(data["success"])
+
+    def test_indented_json_is_rendered_at_once(self):
+        response = self.get(HTTP_ACCEPT="application/json; indent=2")
+
+        self.assertNotIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(len(json.loads(response.render().content)["results"]), 4)
+
+    def test_msgpack_pages_are_rendered_with_msgpack(self):
+        if msgpack is None:
+            self.skipTest("msgpack is not installed")
+
+        response = self.get(HTTP_ACCEPT="application/msgpack")
+
+        self.assertNotIsInstance(response, StreamingHttpResponse)
+        self.assertEqual(len(msgpack_loads(response.render().content)["results"]), 4)
+
+    @override_settings(PAGINATION_MAX_PAGE_SIZE=3)
+    def test_limit_is_capped_at_the_max_page_size(self):
+        request = APIRequestFactory().get("/users/", {"limit": 1000000}, HTTP_ACCEPT="application/json")
+        response = StreamingUserListView.as_view()(request)
+
+        data = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(data["page_size"], 3)
+        self.assertEqual(len(data["results"]), 3)
+        self.assertEqual(data["next"], "http://testserver/users/?limit=1000000&page=2")
+
+    @override_settings(ROOT_URLCONF=__name__)
+    async def test_asgi_pages_are_streamed_asynchronously(self):
+        response = await AsyncClient().get("/users/", {"limit": 5}, HTTP_ACCEPT="application/json")
+
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        emails = [row["email"] for row in json.loads(content)["results"]]
+        self.assertEqual(emails, [f"user{index}@example.com" for index in range(5)])
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # equal timestamps leave the order to the pk tie-break
+        for index in range(5):
+            User.objects.create_user(email=f"user{index}@example.com", password="a-long-password")
+        User.objects.update(date_created=timezone.now())
+        self.emails = list(User.objects.order_by("-pk").values_list("email", flat=True))
+
+    def get(self, url="/users/", **params):
+        return self.client.get(url, params, HTTP_ACCEPT="application/json").json()
+
+    def test_pages_round_trip_forwards_and_backwards(self):
+        pages = [self.get(cursor="", limit=2)]
+        while pages[-1]["next"]:
+            pages.append(self.get(pages[-1]["next"]))
+        self.assertEqual(
+            [[row["email"] for row in page["results"]] for page in pages],
+            [self.emails[0:2], self.emails[2:4], self.emails[4:]],
+        )
+        self.assertIsNone(pages[0]["previous"])
+
+        backwards = [pages[-1]]
+        while backwards[-1]["previous"]:
+            backwards.append(self.get(backwards[-1]["previous"]))
+        self.assertEqual(
+            [[row["email"] for row in page["results"]] for page in backwards],
+            [self.emails[4:], self.emails[2:4], self.emails[0:2]],
+        )
+
+    def test_response_is_wrapped_without_a_count(self):
+        data = self.get(cursor="", limit=2)
+
+        self.assertEqual(sorted(data), ["message", "next", "page_size", "previous", "results", "status", "success"])
+        self.assertEqual([data["status"], data["message"], data["success"]], [200, "Success", True])
+        self.assertEqual(data["page_size"], 2)
+        self.assertIn("cursor=", data["next"])
+        self.assertNotIn("page=", data["next"])
+
+    def test_malformed_cursors_are_rejected(self):
+        tampered = [
+            "not a cursor",
+            urlsafe_b64encode(b"[]").decode(),
+            urlsafe_b64encode(b'{"d": "2024-01-01T00:00:00+00:00", "p": "x", "r": false}').decode(),
+            urlsafe_b64encode(b'{"d": "2024-01-01T00:00:00+00:00", "p": 99999999999999999999, "r": false}').decode(),
+        ]
+        for cursor in tampered:
+            with self.subTest(cursor=cursor):
+                data = self.get(cursor=cursor)
+                self.assertEqual([data["status"], data["message"], data["success"]], [400, "Invalid cursor", False])
+
+
+class PurgeExpiredTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(email="purge@example.com", password="a-long-password")
+        now = timezone.now()
+
+        for index in range(7):
+            UserOTP.objects.create(user=user, code=f"{index:06d}", purpose="auth", is_verified=index % 2 == 0)
+        UserOTP.objects.update(date_created=now - timedelta(days=8))
+        self.live_otps = [UserOTP.objects.create(user=user, code="999999", purpose="auth").pk for _ in range(2)]
+
+        for index in range(5):
+            OutstandingToken.objects.create(
+                user=user, jti=f"expired-{index}", token="token", expires_at=now - timedelta(hours=1)
+            )
+        self.live_token = OutstandingToken.objects.create(
+            user=user, jti="live", token="token", expires_at=now + timedelta(hours=1)
+        ).pk
+
+    def purge(self, **options):
+        out = StringIO()
+        call_command("purge_expired", sleep=0, stdout=out, **options)
+        return out.getvalue()
+
+    def test_only_expired_rows_are_deleted_in_batches(self):
+        output = self.purge(batch_size=2, verbosity=2)
+
+        self.assertEqual(list(UserOTP.objects.order_by("pk").values_list("pk", flat=True)), self.live_otps)
+        self.assertEqual(list(OutstandingToken.objects.values_list("pk", flat=True)), [self.live_token])
+        self.assertEqual(output.count("otp: deleted"), 5)
+        self.assertIn("otp: deleted 7 row(s) in", output)
+        self.assertIn("tokens: deleted 5 row(s) in", output)
+        self.assertEqual(output.count(", 0 remaining"), 2)
+
+    def test_loop_stops_cleanly_when_interrupted(self):
+        # the first wait passes, the second one is interrupted as with Ctrl+C
+        with mock.patch("time.sleep", side_effect=[None, KeyboardInterrupt]):
+            output = self.purge(loop=True, interval=1)
+
+        self.assertEqual(output.count("otp: deleted"), 2)
+        self.assertTrue(output.endswith("Stopped\n"))
+        self.assertEqual(UserOTP.objects.count(), 2)
+
+
+@skipIf(msgpack is None, "msgpack is not installed")
+class MessagePackParserTests(TestCase):
+    def post(self, body, **headers):
+        request = APIRequestFactory().post("/echo/", body, content_type="application/msgpack", **headers)
+        return EchoView.as_view()(request)
+
+    def test_msgpack_bodies_are_parsed(self):
+        response = self.post(msgpack_dumps({"email": "parser@example.com", "codes": [1, 2]}))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["echo"], {"email": "parser@example.com", "codes": [1, 2]})
+
+    def test_malformed_bodies_are_rejected(self):
+        for body in (b"\xc1", msgpack_dumps({"email": "parser@example.com"})[:-3]):
+            with self.subTest(body=body):
+                response = self.post(body)
+                self.assertEqual(response.status_code, 400)
+                self.assertTrue(str(response.data["detail"]).startswith("MessagePack parse error"))
+
+    def test_msgpack_renderer_is_negotiated(self):
+        response = self.post(msgpack_dumps({"email": "parser@example.com"}), HTTP_ACCEPT="application/msgpack")
+
+        self.assertIsInstance(response.accepted_renderer, MessagePackRenderer)
+        response.render()
+        self.assertEqual(response["Content-Type"], "application/msgpack")
+        self.assertEqual(msgpack_loads(response.content), {"echo": {"email": "parser@example.com"}})
+
+
+class SendQueuedEmailsTests(TestCase):
+    def test_queued_emails_are_sent(self):
+        OutgoingEmail.objects.enqueue("First", "Body", "first@example.com")
+        OutgoingEmail.objects.enqueue("Second", "Body", ["second@example.com"])
+
+        call_command("send_queued_emails", stdout=mock.MagicMock())
+
+        self.assertEqual(sorted(message.subject for message in mail.outbox), ["First", "Second"])
+        self.assertEqual(OutgoingEmail.objects.filter(status="SENT", attempts=1).count(), 2)
+
+    def test_connection_errors_are_retried(self):
+        outgoing = OutgoingEmail.objects.enqueue("Subject", "Body", "user@example.com")
+
+        connection = mock.MagicMock()
+        connection.open.side_effect = OSError("connection refused")
+        with mock.patch("app.core.management.commands.send_queued_emails.get_connection", return_value=connection):
+            call_command("send_queued_emails", stdout=mock.MagicMock(), stderr=mock.MagicMock())
+
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, "PENDING")
+        self.assertEqual(outgoing.attempts, 1)
+        self.assertEqual(outgoing.last_error, "connection refused")
+        self.assertFalse(OutgoingEmail.objects.due().exists())
+        self.assertEqual(mail.outbox, [])
+
+    def test_expired_leases_are_claimed_again(self):
+        outgoing = OutgoingEmail.objects.enqueue("Subject", "Body", "user@example.com")
+        OutgoingEmail.objects.filter(pk=outgoing.pk).update(status="SENDING", next_attempt_at=timezone.now())
+
+        call_command("send_queued_emails", stdout=mock.MagicMock())
+
+        outgoing.refresh_from_db()
+        self.assertEqual(outgoing.status, "SENT")
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class TieredCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        # local entries expire at once, so every read goes to the shared tier
+        self.cache = TieredCache(local_timeout=0)
+
+    def test_cached_none_is_a_hit_in_the_shared_tier(self):
+        loader = mock.Mock(return_value=None)
+
+        self.assertIsNone(self.cache.get_or_set("key", loader))
+        self.assertIsNone(self.cache.get_or_set("key", loader))
+
+        self.assertEqual(loader.call_count, 1)
+        self.assertEqual(self.cache.stats()["shared_hits"], 1)
+
+    def test_concurrent_misses_load_once(self):
+        started, release = threading.Event(), threading.Event()
+        loader = mock.Mock(side_effect=lambda: started.set() or release.wait(5) and "value")
+        results = []
+
+        def get():
+            results.append(self.cache.get_or_set("key", loader))
+
+        leader = threading.Thread(target=get)
+        leader.start()
+        started.wait(5)
+        waiters = [threading.Thread(target=get) for _ in range(4)]
+        for thread in waiters:
+            thread.start()
+        release.set()
+        for thread in [leader, *waiters]:
+            thread.join()
+
+        self.assertEqual(results, ["value"] * 5)
+        self.assertEqual(loader.call_count, 1)
+        self.assertEqual(self.cache._inflight, {})
+
+    def test_failed_loads_are_retried_by_the_next_miss(self):
+        loader = mock.Mock(side_effect=[ValueError, "value"])
+
+        with self.assertRaises(ValueError):
+            self.cache.get_or_set("key", loader)
+
+        self.assertEqual(self.cache.get_or_set("key", loader), "value")
+
+    def test_counters_are_served_with_the_metrics(self):
+        self.assertIn('tiered_cache_events_total{event="misses"}', render_metrics())
+
+
+class MetricsTests(TestCase):
+    def test_pool_saturation_is_served_with_the_metrics(self):
+        stats = {"pool_min": 2, "pool_max": 10, "pool_size": 4, "pool_available": 1, "saturation": 0.3}
+        with mock.patch("app.core.metrics.pool_stats", return_value={"default": stats}):
+            metrics = render_metrics()
+
+        self.assertIn('database_pool_stat{alias="default",stat="pool_size"} 4', metrics)
+        self.assertIn('database_pool_saturation{alias="default"} 0.3', metrics)
+        self.assertNotIn('stat="saturation"', metrics)
+
+    @override_settings(ROOT_URLCONF=__name__)
+    async def test_queries_of_async_views_are_recorded(self):
+        response = await AsyncClient().get("/async/count/")
+
+        self.assertIn('desc="1 queries"', response["Server-Timing"])
+
+    def test_new_connections_record_the_queries_of_the_current_request(self):
+        db_queries = []
+
+        def query():
+            start_request_timings()
+            try:
+                User.objects.count()
+                db_queries.append(get_request_timings().db_queries)
+            finally:
+                connections.close_all()
+
+        # a thread opens its own connection
+        thread = threading.Thread(target=query)
+        thread.start()
+        thread.join()
+
+        self.assertEqual(db_queries, [1])
+
+    def test_query_timing_is_installed_once_per_connection(self):
+        connection_created.send(sender=connection.__class__, connection=connection)
+
+        self.assertEqual(connection.execute_wrappers.count(db_execute_wrapper), 1)
+
+    @override_settings(DEBUG=False, METRICS_TOKEN="")
+    def test_metrics_are_not_served_without_a_token(self):
+        self.assertEqual(metrics(RequestFactory().get("/metrics")).status_code, 403)
+
+    @override_settings(DEBUG=False, METRICS_TOKEN="secret")
+    def test_metrics_are_served_with_the_token(self):
+        factory = RequestFactory()
+
+        self.assertEqual(metrics(factory.get("/metrics")).status_code, 401)
+        self.assertEqual(metrics(factory.get("/metrics", HTTP_AUTHORIZATION="Bearer secret")).status_code, 200)
+
+    def test_files_of_exited_workers_are_removed(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            # above the largest pid Linux hands out
+            stale = os.path.join(directory, f"{2 ** 22 + 1}.json")
+            with open(stale, "w") as file:
+                json.dump({"histograms": {}, "queries": {"old|GET": 5}}, file)
+
+            data = histogram_store.collect()
+
+            self.assertFalse(os.path.exists(stale))
+            self.assertTrue(os.path.exists(os.path.join(directory, f"{os.getpid()}.json")))
+            self.assertNotIn("old|GET", data["queries"])
+
+
+class BoundedHasherTests(TestCase):
+    def test_forked_processes_hash_on_their_own_executor(self):
+        # the parent executor threads do not survive a fork
+        make_password("a-long-password")
+
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("fork")) as pool:
+            encoded = pool.submit(make_password, "a-long-password").result(timeout=30)
+
+        self.assertTrue(encoded.startswith("pbkdf2_sha256$"))
+
+
+class HybridMiddlewareTests(TestCase):
+    middleware_classes = (RequestTimingMiddleware, ReplicaPinMiddleware, BaseAPIResponseMiddleware)
+
+    def test_async_get_response_makes_the_middlewares_async(self):
+        async def get_response(request):
+            return Response({})
+
+        for middleware_class in self.middleware_classes:
+            with self.subTest(middleware_class.__name__):
+                middleware = middleware_class(get_response)
+
+                self.assertTrue(iscoroutinefunction(middleware))
+                if hasattr(middleware, "process_template_response"):
+                    self.assertTrue(iscoroutinefunction(middleware.process_template_response))
+
+    def test_sync_get_response_keeps_the_middlewares_sync(self):
+        for middleware_class in self.middleware_classes:
+            with self.subTest(middleware_class.__name__):
+                middleware = middleware_class(lambda request: Response({}))
+
+                self.assertFalse(iscoroutinefunction(middleware))
+                if hasattr(middleware, "process_template_response"):
+                    self.assertFalse(iscoroutinefunction(middleware.process_template_response))
+
+    @override_settings(ROOT_URLCONF=__name__)
+    async def test_async_views_are_wrapped_in_the_envelope(self):
+        response = await AsyncClient().get("/async/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["message"], "pong")
+        self.assertTrue(response.json()["success"])
+
+
+@override_settings(ROOT_URLCONF=__name__)
+class BaseAPIResponseMiddlewareTests(TestCase):
+    # bodies written by the middleware before responses were encoded by the negotiated renderer,
+    # which writes the same envelope without the whitespace of `json.dumps`
+    legacy_bodies = {
+        "/envelope/success/": (
+            b'{"message": "Created", "result": {"email": "envelope@example.com", "score": 1.5}, '
+            b'"status": 201, "success": true}'
+        ),
+        "/envelope/error/": (
+            b'{"result": {}, "message": "Passwords didn\'t match.", "status": 400, '
+            b'"errors": {"email": ["This field is required."]}, "success": false}'
+        ),
+        "/envelope/error/?detail=1": b'{"result": {}, "message": "Not found.", "status": 404, "success": false}',
+        "/users/?limit=2": (
+            b'{"count": 3, "count_type": "exact", "page_size": 2, "current_page": 1, '
+            b'"next": "http://testserver/users/?limit=2&page=2", "previous": null, "status": 200, '
+            b'"message": "Success", "success": true, '
+            b'"results": [{"email": "user0@example.com"}, {"email": "user1@example.com"}]}'
+        ),
+    }
+
+    def setUp(self):
+        cache.clear()
+        for index in range(3):
+            User.objects.create_user(email=f"user{index}@example.com", password="a-long-password")
+
+    def test_envelope_matches_the_legacy_bodies(self):
+        for url, body in self.legacy_bodies.items():
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_ACCEPT="application/json")
+
+                expected = json.dumps(json.loads(body), separators=(",", ":"), ensure_ascii=False).encode()
+                self.assertEqual(response.content, expected)
+                self.assertEqual(response.status_code, 201 if url == "/envelope/success/" else 200)
+                self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_default_response_header_returns_the_raw_payload(self):
+        response = self.client.get("/envelope/success/", HTTP_USE_DEFAULT_RESPONSE="true")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.json(), {"message": "Created", "result": {"email": "envelope@example.com", "score": 1.5}}
+        )
+
+        response = self.client.get("/envelope/error/", HTTP_USE_DEFAULT_RESPONSE="true")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json(), {"email": ["This field is required."], "non_field_errors": ["Passwords didn't match."]}
+        )
+
+    def wrapped(self):
+        wrap = mock.patch.object(BaseAPIResponseMiddleware, "wrap_response", autospec=True)
+        wrap_response = BaseAPIResponseMiddleware.wrap_response
+        mocked = wrap.start()
+        mocked.side_effect = wrap_response
+        self.addCleanup(wrap.stop)
+        return mocked
+
+    def test_responses_are_wrapped_once(self):
+        wrap = self.wrapped()
+        response = self.client.get("/envelope/success/")
+
+        self.assertEqual(wrap.call_count, 1)
+        self.assertEqual(response.json()["status"], 201)
+
+    def test_rendered_responses_are_wrapped_once(self):
+        request = APIRequestFactory().get("/envelope/success/", HTTP_ACCEPT="application/json")
+        middleware = BaseAPIResponseMiddleware(lambda request: EnvelopeSuccessView.as_view()(request).render())
+        wrap = self.wrapped()
+
+        response = middleware.process_response(request, middleware(request))
+
+        self.assertEqual(wrap.call_count, 1)
+        self.assertEqual(json.loads(response.content)["status"], 201)
+        self.assertTrue(json.loads(response.content)["success"])
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaPinningTests(TransactionTestCase):
+    # outside the TestCase transaction, which keeps every read on the primary
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        self.reads = []
+        self.middleware = ReplicaPinMiddleware(self.view)
+
+    def view(self, request):
+        if request.method == "POST":
+            User.objects.create_user(email="pinned@example.com", password="a-long-password")
+        self.reads.append(User.objects.db)
+        return HttpResponse()
+
+    def test_reads_go_to_the_replica(self):
+        response = self.middleware(RequestFactory().get("/"))
+
+        self.assertEqual(self.reads, ["replica"])
+        self.assertNotIn(settings.DATABASE_REPLICA_COOKIE, response.cookies)
+
+    def test_writes_pin_the_next_request_of_the_client_to_the_primary(self):
+        factory = RequestFactory()
+        response = self.middleware(factory.post("/"))
+        cookie = response.cookies[settings.DATABASE_REPLICA_COOKIE]
+        self.assertEqual(cookie["max-age"], settings.DATABASE_REPLICA_STICKY_SECONDS)
+
+        request = factory.get("/")
+        request.COOKIES[settings.DATABASE_REPLICA_COOKIE] = cookie.value
+        self.middleware(request)
+        self.middleware(factory.get("/"))
+
+        # the write, the pinned client, then another client
+        self.assertEqual(self.reads, ["default", "default", "replica"])
+        # the replica mirrors the primary in tests
+        self.assertTrue(User.objects.using("replica").filter(email="pinned@example.com").exists())
+
+    def test_use_primary_pins_reads(self):
+        with use_primary():
+            self.assertEqual(User.objects.db, "default")
+
+
+class FastJSONRendererTests(TestCase):
+    class TagsSerializer(serializers.Serializer):
+        tags = serializers.ListField(child=serializers.IntegerField())
+        scores = serializers.DictField(child=serializers.IntegerField())
+
+    def get_payloads(self):
+        serializer = self.TagsSerializer(data={"tags": [1, "x"], "scores": {"a": "y"}})
+        serializer.is_valid()
+        return {
+            "int keyed errors": serializer.errors,
+            "lazy strings": {"message": gettext_lazy("Invalid credentials")},
+            "datetimes": {
+                "aware": datetime(2024, 5, 1, 12, 30, 15, 123456, tzinfo=dt_timezone.utc),
+                "naive": datetime(2024, 5, 1, 12, 30, 15),
+            },
+            "decimals": {"amount": Decimal("1250.50"), "rate": Decimal("0.1")},
+            "uuids and text": {"id": uuid.UUID(int=1), "name": "Zoë"},
+        }
+
+    def assert_renders_like_drf(self):
+        for name, payload in self.get_payloads().items():
+            with self.subTest(name):
+                self.assertEqual(FastJSONRenderer().render(payload), renderers.JSONRenderer().render(payload))
+
+    def test_output_matches_the_drf_renderer(self):
+        self.assert_renders_like_drf()
+
+    def test_stdlib_fallback_matches_the_drf_renderer(self):
+        with mock.patch("app.core.encoders.orjson", None):
+            self.assert_renders_like_drf()
+
+    def test_int_keyed_errors_are_rendered_with_string_keys(self):
+        self.assertEqual(json.loads(json_dumps({"tags": {1: ["Invalid"]}})), {"tags": {"1": ["Invalid"]}})
+
+    def test_has_error_detail_finds_nested_errors(self):
+        self.assertTrue(has_error_detail({"tags": {0: [ErrorDetail("Invalid", code="invalid")]}}))
+        self.assertTrue(has_error_detail([{"email": (ErrorDetail("Required", code="required"),)}]))
+        self.assertFalse(has_error_detail({"message": "Invalid", "results": [{"id": 1}]}))
+        self.assertFalse(has_error_detail("Invalid"))
 
-# Create your tests here.
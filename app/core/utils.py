@@ -1,28 +1,56 @@
 from django.core.mail import EmailMessage, EmailMultiAlternatives
 from django.conf import settings
+from .models import OutgoingEmail
 
 
 class Util:
-    """A class containing functions to send mails."""
+    """
+    A class containing functions to send mails. Mails are queued in the `OutgoingEmail`
+    outbox and delivered by the `send_queued_emails` management command.
+    """
 
     @staticmethod
     def send_email(data):
         """Send emails with no attachment"""
-        email = EmailMessage(subject=data["email_subject"], body=data["email_body"], to=[data["to_email"]])
-        email.send()
+        OutgoingEmail.objects.enqueue(subject=data["email_subject"], body=data["email_body"], to=[data["to_email"]])
 
     @staticmethod
     def send_email_attach(msg, url):
         """Send emails with attachments"""
         body_html = "<html><p>This is your ticket</p></html>"
 
-        message = EmailMultiAlternatives(
+        OutgoingEmail.objects.enqueue(
             subject=msg["subject"],
-            from_email=settings.DEFAULT_FROM_EMAIL,
+            body="",
             to=[msg["recipient"]],
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            html_body=body_html,
+            attachments=["{}".format(url)],
         )
-        message.mixed_subtype = "related"
-        message.attach_alternative(body_html, "text/html")
-        message.attach_file("{}".format(url))
 
-        message.send(fail_silently=False)
+    @staticmethod
+    def build_email(outgoing, connection=None):
+        """Build the email message of a queued `OutgoingEmail`"""
+        if outgoing.html_body or outgoing.attachments:
+            message = EmailMultiAlternatives(
+                subject=outgoing.subject,
+                body=outgoing.body,
+                from_email=outgoing.from_email,
+                to=outgoing.to,
+                connection=connection,
+            )
+            if outgoing.html_body:
+                message.mixed_subtype = "related"
+                message.attach_alternative(outgoing.html_body, "text/html")
+            for path in outgoing.attachments:
+                message.attach_file(path)
+
+            return message
+
+        return EmailMessage(
+            subject=outgoing.subject,
+            body=outgoing.body,
+            from_email=outgoing.from_email,
+            to=outgoing.to,
+            connection=connection,
+        )
@@ -2,7 +2,12 @@
 This file contains global views for the project
 """
 
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.functional import classproperty
+from rest_framework import generics
+from .metrics import render_metrics
 
 
 def error_404(request, exception):
@@ -21,3 +26,53 @@ def error_500(request):
     response.status_code = 500
 
     return response
+
+
+def metrics(request):
+    """
+    View serving the request metrics of every worker in the Prometheus text format,
+    protected by `METRICS_TOKEN`. Without a token it is only served when DEBUG is on.
+    """
+    token = getattr(settings, "METRICS_TOKEN", "")
+    if not token and not settings.DEBUG:
+        return HttpResponse(status=403)
+    if token and request.headers.get("Authorization") != f"Bearer {token}":
+        return HttpResponse(status=401)
+
+    return HttpResponse(render_metrics(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+class AsyncGenericAPIView(generics.GenericAPIView):
+    """
+    Generic API view dispatching to `async def` handlers natively under ASGI.
+    Authentication, permissions and throttling run in a single `sync_to_async` call
+    since they may query the database.
+    """
+
+    @classproperty
+    def view_is_async(cls):
+        return True
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if hasattr(response, "__await__"):
+                response = await response
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
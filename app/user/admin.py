@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.models import Group
 from django.contrib.auth.admin import GroupAdmin, UserAdmin as BaseUserAdmin
-from .models import User, UserProfile, UserOTP
+from .models import User, UserProfile, UserOTP, UserDirectory
 
 
 class UserProfileInline(admin.StackedInline):
@@ -87,3 +87,4 @@ class UserProfileAdmin(admin.ModelAdmin):
 admin.site.register(User, UserAdmin)
 admin.site.register(UserProfile, UserProfileAdmin)
 admin.site.register(UserOTP)
+admin.site.register(UserDirectory)
@@ -0,0 +1,87 @@
+"""
+This file contains authentication classes for the User App
+"""
+
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+from app.core.cache import tiered_cache
+from .models import User
+from .sharding import shard_for_user_id
+
+
+def user_snapshot_cache_key(user_id) -> str:
+    return f"auth:user:{user_id}"
+
+
+def invalidate_user_snapshot(user_id) -> None:
+    """
+    Function to remove the cached authentication snapshot of a user
+    """
+    tiered_cache.delete(user_snapshot_cache_key(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication resolving the user from a compact snapshot cached for
+    `AUTH_USER_CACHE_TIMEOUT` seconds. The snapshot holds `snapshot_fields` and the
+    profile confirmation read by `is_profile_confirmed`, which covers
+    `IsFullyGrantedPermission` and the token helpers. Any other field, e.g. `password`
+    or `secret_keys`, and `user.profile` cost a query on first access: keep permission
+    classes within the snapshot or add the fields they read to `snapshot_fields`.
+
+    The snapshot is read from the shared cache on every request, never from the in-process
+    tier, so deactivating a user or changing their password, which invalidates it, takes
+    effect in every worker at once. With `CHECK_REVOKE_TOKEN` the snapshot keeps the MD5 of
+    the password hash that tokens are checked against, never the hash itself.
+    """
+
+    snapshot_fields = ("pkid", "id", "email", "is_active", "is_confirmed", "is_staff", "is_superuser")
+
+    def load_snapshot(self, user_id) -> dict:
+        snapshot = (
+            User.objects.using(shard_for_user_id(user_id))
+            .filter(**{api_settings.USER_ID_FIELD: user_id})
+            .values(*self.snapshot_fields, "password", "profile__is_confirmed")
+            .first()
+        )
+        if snapshot is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        snapshot["password_marker"] = get_md5_hash_password(snapshot.pop("password"))
+        return snapshot
+
+    def get_snapshot(self, user_id) -> dict:
+        key = user_snapshot_cache_key(user_id)
+        snapshot = tiered_cache.shared.get(key)
+        if snapshot is None:
+            snapshot = self.load_snapshot(user_id)
+            tiered_cache.shared.set(key, snapshot, getattr(settings, "AUTH_USER_CACHE_TIMEOUT", 60))
+
+        return snapshot
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        snapshot = self.get_snapshot(user_id)
+        if not snapshot["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if (
+            api_settings.CHECK_REVOKE_TOKEN
+            and validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != snapshot["password_marker"]
+        ):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        db = shard_for_user_id(snapshot["id"]) or User.objects.db
+        # from_db expects the values of a partial row in the order of the model fields
+        field_names = [f.attname for f in User._meta.concrete_fields if f.attname in self.snapshot_fields]
+        user = User.from_db(db, field_names, [snapshot[name] for name in field_names])
+        user.profile_confirmed = snapshot["profile__is_confirmed"]
+
+        return user
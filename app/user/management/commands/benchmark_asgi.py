@@ -0,0 +1,74 @@
+"""
+Management command to compare the sync and async login views served through the ASGI handler
+"""
+
+import asyncio
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncClient, override_settings
+from django.urls import path
+
+from app.user.models import User
+from app.user.views import AsyncLoginView, LoginView
+
+urlpatterns = [
+    path("sync/login/", LoginView.as_view()),
+    path("async/login/", AsyncLoginView.as_view()),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Load test LoginView and AsyncLoginView through Django's ASGI handler at a fixed concurrency and "
+        "report requests/sec with p50, p95 and p99 latencies. The benchmark user is deleted afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=400, help="Requests sent per view.")
+        parser.add_argument("--concurrency", type=int, default=20, help="Requests in flight at once.")
+        parser.add_argument("--iterations", type=int, default=1000, help="PASSWORD_HASH_ITERATIONS used.")
+
+    def handle(self, *args, **options):
+        with override_settings(ROOT_URLCONF=__name__, PASSWORD_HASH_ITERATIONS=options["iterations"]):
+            # the views run on their own threads and connections, so the user has to be committed
+            user = User.objects.create_user(
+                email="benchmark-asgi@example.com", password="benchmark-password", is_active=True, is_confirmed=True
+            )
+            try:
+                for name in ("sync", "async"):
+                    asyncio.run(self.benchmark(name, user.email, options["requests"], options["concurrency"]))
+            finally:
+                user.delete()
+
+    async def benchmark(self, name, email, number, concurrency):
+        client = AsyncClient()
+        data = {"email": email, "password": "benchmark-password"}
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, failures = [], 0
+
+        async def login():
+            nonlocal failures
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post(f"/{name}/login/", data, content_type="application/json")
+                latencies.append(time.perf_counter() - start)
+                failures += response.status_code != 200
+
+        # warm up the connections, the hashing executor and the caches
+        await login()
+        latencies.clear()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(number)))
+        elapsed = time.perf_counter() - start
+        if failures:
+            raise CommandError(f"{name}: {failures} of {number} logins failed")
+
+        percentiles = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f"{name} LoginView, concurrency {concurrency}: {number / elapsed:.0f} requests/s, "
+            f"p50 {percentiles[49] * 1000:.1f} ms, p95 {percentiles[94] * 1000:.1f} ms, "
+            f"p99 {percentiles[98] * 1000:.1f} ms"
+        )
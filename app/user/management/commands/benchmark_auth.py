@@ -0,0 +1,69 @@
+"""
+Management command to compare the cached user snapshot authentication with the default JWT authentication
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.tokens import AccessToken
+
+from app.core.permissions import IsFullyGrantedPermission
+from app.user.authentication import CachedJWTAuthentication, invalidate_user_snapshot
+from app.user.models import User, UserProfile
+
+
+class BenchmarkView(APIView):
+    permission_classes = [IsFullyGrantedPermission]
+
+    def get(self, request):
+        return Response({"id": request.user.id})
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark requests/sec and queries per request of an endpoint guarded by IsFullyGrantedPermission, "
+        "authenticated with JWTAuthentication and with CachedJWTAuthentication. The benchmark user is "
+        "created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=2000, help="Requests timed per authentication class.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            user = User.objects.create_user(
+                email="benchmark-auth@example.com", password=None, is_active=True, is_confirmed=True
+            )
+            UserProfile.objects.filter(user=user).update(is_confirmed=True)
+            request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(user)}")
+
+            for authentication_class in (JWTAuthentication, CachedJWTAuthentication):
+                self.benchmark(authentication_class, request, options["number"])
+
+            transaction.set_rollback(True)
+        invalidate_user_snapshot(user.id)
+
+    def benchmark(self, authentication_class, request, number):
+        view = BenchmarkView.as_view(authentication_classes=[authentication_class])
+        # the first request fills the snapshot cache
+        if view(request).status_code != 200:
+            raise CommandError(f"{authentication_class.__name__} did not authenticate the benchmark user")
+
+        with CaptureQueriesContext(connection) as queries:
+            view(request)
+
+        start = time.perf_counter()
+        for _ in range(number):
+            view(request)
+        elapsed = time.perf_counter() - start
+
+        self.stdout.write(
+            f"{authentication_class.__name__}: {number / elapsed:.0f} requests/s, "
+            f"{len(queries)} queries per request"
+        )
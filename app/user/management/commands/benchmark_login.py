@@ -0,0 +1,75 @@
+"""
+Management command to compare single-mint token issuance with the previous two token pairs per login
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from app.user.models import User
+from app.user.serializers import LoginSerializer
+from app.user.tokens import flush_outstanding_tokens, issue_tokens
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the token issuance of a login: the previous user re-query and two token pairs, "
+        "single-mint issue_tokens, and issue_tokens with batched OutstandingToken inserts. Also times "
+        "full LoginSerializer logins, which include password hashing. Rows are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--number", type=int, default=1000, help="Token issuances timed per variant.")
+        parser.add_argument("--logins", type=int, default=20, help="Full logins timed.")
+        parser.add_argument("--batch-size", type=int, default=50, help="TOKEN_OUTSTANDING_BATCH_SIZE to compare.")
+
+    def handle(self, *args, **options):
+        number = options["number"]
+
+        with transaction.atomic():
+            user = User.objects.create_user(
+                email="benchmark-login@example.com", password="benchmark-password", is_active=True, is_confirmed=True
+            )
+
+            def two_pairs():
+                # the previous LoginSerializer.get_tokens: re-query the user and call user.tokens() twice
+                for _ in range(2):
+                    refresh = RefreshToken.for_user(User.objects.get(email=user.email))
+                    {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+            self.report("two pairs per login (previous)", two_pairs, number, user)
+            with override_settings(TOKEN_OUTSTANDING_BATCH_SIZE=1):
+                self.report("single mint", lambda: issue_tokens(user), number, user)
+            with override_settings(
+                TOKEN_OUTSTANDING_BATCH_SIZE=options["batch_size"], TOKEN_OUTSTANDING_FLUSH_SECONDS=3600
+            ):
+                name = f"single mint, batches of {options['batch_size']}"
+                self.report(name, lambda: issue_tokens(user), number, user)
+
+            data = {"email": user.email, "password": "benchmark-password"}
+            self.report(
+                "full login",
+                lambda: LoginSerializer(data=data).is_valid(raise_exception=True),
+                options["logins"],
+                user,
+            )
+
+            transaction.set_rollback(True)
+
+    def report(self, name, func, number, user):
+        rows = OutstandingToken.objects.filter(user=user).count()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        flush_outstanding_tokens()
+        elapsed = time.perf_counter() - start
+        rows = OutstandingToken.objects.filter(user=user).count() - rows
+
+        self.stdout.write(
+            f"{name}: {number / elapsed:.0f} logins/s, {elapsed / number * 1000:.2f} ms per login, "
+            f"{rows / number:.0f} OutstandingToken row(s) per login"
+        )
@@ -0,0 +1,68 @@
+"""
+Management command to measure what deferring the OTP secret keys saves on user fetches
+"""
+
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models.functions import Cast, Length
+
+from app.user.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark fetching users by email with the default manager, which defers secret_keys, against "
+        "fetching the full row. The benchmark users are created in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000, help="Users created for the benchmark.")
+        parser.add_argument("--number", type=int, default=2000, help="Lookups timed per run.")
+        parser.add_argument("--repeat", type=int, default=5, help="Runs per variant, the fastest is reported.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            password = make_password("benchmark-password")
+            users = [
+                User(email=f"benchmark-fetch-{index}@example.com", password=password)
+                for index in range(options["users"])
+            ]
+            for user in users:
+                user.secret_keys = user.initiate_all_sk()
+            User.objects.bulk_create(users)
+            emails = [user.email for user in users]
+
+            self.report_sizes(emails)
+            full, narrow = [], []
+            # alternate the variants so both see the same cache and CPU conditions
+            for _ in range(options["repeat"]):
+                full.append(self.time_lookups(User.objects.with_secret_keys(), emails, options["number"]))
+                narrow.append(self.time_lookups(User.objects.all(), emails, options["number"]))
+            full, narrow = min(full), min(narrow)
+            self.stdout.write(
+                f"lookup by email: full row {full * 1e6:.1f} us, deferred secret_keys {narrow * 1e6:.1f} us "
+                f"({(narrow - full) / full * 100:+.0f}%)"
+            )
+
+            transaction.set_rollback(True)
+
+    def report_sizes(self, emails):
+        sizes = User.objects.with_secret_keys().filter(email__in=emails).aggregate(
+            secret_keys=models.Avg(Length(Cast("secret_keys", models.TextField()))),
+            password=models.Avg(Length("password")),
+            email=models.Avg(Length("email")),
+        )
+        self.stdout.write(
+            f"average column bytes: secret_keys {sizes['secret_keys']:.0f}, password {sizes['password']:.0f}, "
+            f"email {sizes['email']:.0f}"
+        )
+
+    def time_lookups(self, queryset, emails, number) -> float:
+        start = time.perf_counter()
+        for index in range(number):
+            queryset.get(email=emails[index % len(emails)])
+
+        return (time.perf_counter() - start) / number
@@ -0,0 +1,197 @@
+"""
+Management command to import users in bulk from a CSV or JSON Lines file
+"""
+
+import csv
+import json
+import time
+from concurrent.futures import ProcessPoolExecutor
+from collections import defaultdict
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, router, transaction
+from django.db.models.functions import Lower
+
+from app.core.validators import validate_name, validate_password_format
+from app.user.models import User, UserDirectory, UserProfile
+from app.user.sharding import invalidate_directory, is_sharded
+
+
+def _setup_worker():
+    django.setup()
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users from a CSV or JSON Lines file with email, password and optional first_name, "
+        "last_name and phone columns. Rows are inserted in chunks with bulk_create."
+    )
+
+    profile_fields = ("first_name", "last_name", "phone")
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Path of the CSV or JSON Lines file to import.")
+        parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format, guessed from the extension.")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+        parser.add_argument("--workers", type=int, default=None, help="Processes used to hash passwords.")
+        parser.add_argument("--confirmed", action="store_true", help="Mark imported users as confirmed and active.")
+
+    def read_rows(self, file, input_format):
+        """
+        Function to yield the line number and content of each row, rows that cannot be
+        parsed are yielded as None after their error is reported
+        """
+        if input_format == "csv":
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+        else:
+            for line_number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    yield line_number, json.loads(line)
+                except json.JSONDecodeError as exc:
+                    self.stderr.write(f"Skipping line {line_number}: invalid JSON ({exc.msg})")
+                    yield line_number, None
+
+    def validate_row(self, row):
+        """
+        Function to validate a row with the project validators, returns the error message if invalid
+        """
+        if not isinstance(row, dict):
+            return "expected an object with email and password"
+
+        try:
+            validate_email(row.get("email") or "")
+            validate_password_format(row.get("password") or "")
+            for field in ("first_name", "last_name"):
+                if row.get(field):
+                    validate_name(row[field])
+        except ValidationError as exc:
+            return " ".join(exc.messages)
+
+        return None
+
+    def handle(self, *args, **options):
+        input_format = options["format"] or ("jsonl" if options["path"].endswith((".jsonl", ".json")) else "csv")
+        chunk_size = options["chunk_size"]
+        imported = skipped = 0
+        start = time.perf_counter()
+
+        try:
+            file = open(options["path"], newline="", encoding="utf-8")
+        except OSError as exc:
+            raise CommandError(f"Unable to open {options['path']}: {exc}")
+
+        with file, ProcessPoolExecutor(max_workers=options["workers"], initializer=_setup_worker) as pool:
+            rows = self.read_rows(file, input_format)
+            while True:
+                chunk = list(islice(rows, chunk_size))
+                if not chunk:
+                    break
+
+                chunk_start = time.perf_counter()
+                created, invalid = self.import_chunk(chunk, pool, options["confirmed"])
+                imported += created
+                skipped += invalid
+
+                elapsed = time.perf_counter() - chunk_start
+                self.stdout.write(
+                    f"Imported {created} user(s), skipped {invalid} ({len(chunk) / elapsed:.0f} rows/sec)"
+                )
+
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Imported {imported} user(s), skipped {skipped} in {elapsed:.1f}s "
+                f"({(imported + skipped) / elapsed if elapsed else 0:.0f} rows/sec)"
+            )
+        )
+
+    def import_chunk(self, chunk, pool, confirmed):
+        """
+        Function to validate, hash and insert one chunk of rows. Returns the number of
+        users created and the number of rows skipped.
+        """
+        # emails are unique regardless of case, like the registration serializer checks them
+        valid_rows = {}
+        for line_number, row in chunk:
+            error = self.validate_row(row)
+            if error:
+                self.stderr.write(f"Skipping line {line_number}: {error}")
+                continue
+            email = User.objects.normalize_email(row["email"])
+            valid_rows.setdefault(email.lower(), (email, row))
+
+        for email in self.get_existing_emails(list(valid_rows)):
+            del valid_rows[email]
+
+        passwords = pool.map(make_password, [row["password"] for _, row in valid_rows.values()], chunksize=64)
+
+        users = defaultdict(list)
+        for (email, row), password in zip(valid_rows.values(), passwords):
+            user = User(email=email, password=password, is_confirmed=confirmed, is_active=confirmed)
+            user.secret_keys = user.initiate_all_sk()
+            profile = UserProfile(user=user, **{field: row.get(field) or None for field in self.profile_fields})
+            users[router.db_for_write(User, instance=user)].append((user, profile))
+
+        created = 0
+        for using, shard_users in users.items():
+            shard_users = self.insert_users(using, shard_users)
+            for user, _ in shard_users:
+                User.objects.invalidate_cached(user)
+                if is_sharded():
+                    invalidate_directory(user.email, user.id)
+            created += len(shard_users)
+
+        return created, len(chunk) - created
+
+    def get_existing_emails(self, emails) -> set:
+        """
+        Function to return the lowercased emails, among the given lowercased ones, already registered
+        """
+        # sharded users are spread over several databases, the directory holds every email
+        existing_users = UserDirectory.objects if is_sharded() else User.objects
+        return set(
+            existing_users.annotate(email_lower=Lower("email"))
+            .filter(email_lower__in=emails)
+            .values_list("email_lower", flat=True)
+        )
+
+    def insert_users(self, using, shard_users) -> list:
+        """
+        Function to insert the users and profiles of a database, and their directory entries, in one
+        transaction. Users registered concurrently since the chunk was checked are dropped and the
+        insert is retried. Returns the inserted (user, profile) pairs.
+        """
+        while shard_users:
+            try:
+                # bulk_create skips User.save and its signals, so profiles and directory entries are created here
+                # default commits after the shard, a failed shard commit leaves no directory entries
+                with transaction.atomic(using=DEFAULT_DB_ALIAS), transaction.atomic(using=using):
+                    User.objects.using(using).bulk_create([user for user, _ in shard_users])
+                    UserProfile.objects.using(using).bulk_create([profile for _, profile in shard_users])
+                    if is_sharded():
+                        UserDirectory.objects.bulk_create(
+                            [UserDirectory(email=user.email, user_id=user.id, shard=using) for user, _ in shard_users]
+                        )
+                return shard_users
+            except IntegrityError:
+                existing = self.get_existing_emails([user.email.lower() for user, _ in shard_users])
+                if not existing:
+                    raise
+                for user, _ in shard_users:
+                    if user.email.lower() in existing:
+                        self.stderr.write(f"Skipping {user.email!r}: registered during the import")
+                shard_users = [(user, profile) for user, profile in shard_users if user.email.lower() not in existing]
+                for user, profile in shard_users:
+                    # bulk_create set the primary keys before the rollback
+                    user.pkid = profile.pkid = None
+
+        return shard_users
@@ -0,0 +1,153 @@
+"""
+Management command to move users to the shard their id is placed on, e.g. after appending a shard
+"""
+
+from django.contrib.auth.models import Group, Permission
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+from app.user.authentication import invalidate_user_snapshot
+from app.user.models import User, UserDirectory, UserOTP, UserProfile
+from app.user.sharding import invalidate_directory, is_sharded, placement_shard, user_shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Move every user on the wrong shard, with its profile, OTPs and tokens, to the shard given by "
+        "USER_SHARDS and update the user directory. Groups and permissions are matched on the target shard "
+        "by natural key, users whose groups or permissions are missing there are reported and not moved. "
+        "Safe to run again after an interruption."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500, help="Users read per query.")
+        parser.add_argument("--dry-run", action="store_true", help="Only count the users that would move.")
+        parser.add_argument(
+            "--rebuild-directory",
+            action="store_true",
+            help="Also record the users already on their shard, e.g. when sharding an existing database.",
+        )
+
+    def handle(self, *args, **options):
+        if not is_sharded():
+            raise CommandError("USER_SHARDS is empty, users are not sharded")
+
+        moved = recorded = failed = 0
+        for source in user_shards():
+            last_pk = 0
+            while True:
+                users = list(
+                    User.objects.with_secret_keys()
+                    .using(source)
+                    .filter(pkid__gt=last_pk)
+                    .order_by("pkid")[: options["batch_size"]]
+                )
+                if not users:
+                    break
+                last_pk = users[-1].pkid
+
+                for user in users:
+                    target = placement_shard(user.id)
+                    if target == source:
+                        if options["rebuild_directory"] and not options["dry_run"]:
+                            self.record(user, source)
+                            recorded += 1
+                        continue
+
+                    try:
+                        memberships = self.get_memberships(user, target)
+                    except CommandError as exc:
+                        self.stderr.write(f"Not moving {user.email}: {exc}")
+                        failed += 1
+                        continue
+
+                    if not options["dry_run"]:
+                        self.move_user(user, source, target, memberships)
+                    moved += 1
+
+            self.stdout.write(f"{source}: scanned up to pk {last_pk}")
+
+        action = "Would move" if options["dry_run"] else "Moved"
+        self.stdout.write(self.style.SUCCESS(f"{action} {moved} user(s), recorded {recorded}"))
+        if failed:
+            raise CommandError(
+                f"{failed} user(s) were not moved, create their groups and permissions on the target shard "
+                "and run the command again"
+            )
+
+    def record(self, user, shard):
+        UserDirectory.objects.update_or_create(user_id=user.id, defaults={"email": user.email, "shard": shard})
+        invalidate_directory(user.email, user.id)
+
+    def get_memberships(self, user, target) -> tuple:
+        """
+        Function to return the groups and permissions of the user on the target shard, every
+        shard has its own auth tables so they are matched by group name and permission codename
+        """
+        groups, permissions = [], []
+        for name in user.groups.values_list("name", flat=True):
+            try:
+                groups.append(Group.objects.db_manager(target).get_by_natural_key(name))
+            except Group.DoesNotExist:
+                raise CommandError(f"group {name!r} does not exist on {target}")
+
+        natural_keys = user.user_permissions.values_list("codename", "content_type__app_label", "content_type__model")
+        for codename, app_label, model in natural_keys:
+            try:
+                permission = Permission.objects.db_manager(target).get_by_natural_key(codename, app_label, model)
+                permissions.append(permission)
+            except Permission.DoesNotExist:
+                raise CommandError(f"permission {app_label}.{codename} does not exist on {target}")
+
+        return groups, permissions
+
+    def move_user(self, user, source, target, memberships):
+        """
+        Function to copy a user and its rows to the target shard, point the directory at it
+        and only then delete the rows from the source shard.
+        """
+        groups, permissions = memberships
+        old_pkid = user.pkid
+
+        # a previous run may have copied the user before being interrupted
+        if not User.objects.using(target).filter(id=user.id).exists():
+            profile = UserProfile.objects.using(source).filter(user_id=user.id).first()
+            otps = list(UserOTP.objects.using(source).filter(user_id=user.id))
+            tokens = list(OutstandingToken.objects.using(source).filter(user_id=old_pkid))
+            blacklisted = set(
+                BlacklistedToken.objects.using(source)
+                .filter(token__user_id=old_pkid)
+                .values_list("token__jti", flat=True)
+            )
+
+            # bulk_create skips the signals, which would create a second profile
+            with transaction.atomic(using=target):
+                user.pkid = None
+                User.objects.using(target).bulk_create([user])
+                User.groups.through.objects.using(target).bulk_create(
+                    [User.groups.through(user_id=user.pkid, group_id=group.pk) for group in groups]
+                )
+                User.user_permissions.through.objects.using(target).bulk_create(
+                    [User.user_permissions.through(user_id=user.pkid, permission_id=perm.pk) for perm in permissions]
+                )
+                if profile is not None:
+                    profile.pkid = None
+                    UserProfile.objects.using(target).bulk_create([profile])
+                for otp in otps:
+                    otp.pk = None
+                UserOTP.objects.using(target).bulk_create(otps)
+                for token in tokens:
+                    token.pk = None
+                    token.user_id = user.pkid
+                OutstandingToken.objects.using(target).bulk_create(tokens)
+                BlacklistedToken.objects.using(target).bulk_create(
+                    [BlacklistedToken(token=token) for token in tokens if token.jti in blacklisted]
+                )
+
+        self.record(user, target)
+        with transaction.atomic(using=source):
+            User.objects.using(source).filter(pkid=old_pkid).delete()
+
+        User.objects.invalidate_cached(user)
+        invalidate_user_snapshot(user.id)
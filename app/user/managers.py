@@ -1,27 +1,87 @@
+from contextlib import nullcontext
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth.models import BaseUserManager
 from django.contrib.auth.hashers import make_password
+from django.db import DEFAULT_DB_ALIAS, router, transaction
+from app.core.hashers import arun_hashing
+from app.core.managers import CachedLookupMixin
+from .sharding import is_sharded
 
 
-class UserManager(BaseUserManager):
-    """Model manager for the User Model"""
+class UserManager(CachedLookupMixin, BaseUserManager):
+    """
+    Model manager for the User Model. The OTP `secret_keys` column is deferred so
+    login and authentication lookups do not load and decode it, use `with_secret_keys`
+    on OTP code paths. Users can be looked up by id or email through `get_cached`.
 
-    def _create_user(self, email, password, **extra_fields):
+    When users are sharded, look users up with `by_email` or `by_id` so the query
+    runs on the shard holding the user, and with `aby_email` in async code since
+    finding the shard may query the user directory.
+    """
+
+    cached_lookup_fields = ("id", "email")
+
+    def get_queryset(self):
+        return super().get_queryset().defer("secret_keys")
+
+    def with_secret_keys(self):
+        return super().get_queryset()
+
+    def by_email(self, email, with_secret_keys=False):
+        from .sharding import shard_for_email
+
+        queryset = self.with_secret_keys() if with_secret_keys else self.get_queryset()
+        return queryset.using(shard_for_email(email)).filter(email=email)
+
+    async def aby_email(self, email, with_secret_keys=False):
+        return await sync_to_async(self.by_email)(email, with_secret_keys)
+
+    def by_id(self, user_id, with_secret_keys=False):
+        from .sharding import shard_for_user_id
+
+        queryset = self.with_secret_keys() if with_secret_keys else self.get_queryset()
+        return queryset.using(shard_for_user_id(user_id)).filter(id=user_id)
+
+    def get_by_natural_key(self, email):
+        return self.by_email(email).get()
+
+    async def aget_by_natural_key(self, email):
+        return await (await self.aby_email(email)).aget()
+
+    def get_cached_queryset(self, field, value):
+        return self.by_email(value) if field == "email" else self.by_id(value)
+
+    def _insert_user(self, email, encoded_password, **extra_fields):
         if not email:
             raise ValueError("Email must be set for this user")
         email = self.normalize_email(email)
 
-        user = self.model(email=email, **extra_fields)
-        user.password = make_password(password)
-        user.save(using=self._db)
-        user.save()
+        user = self.model(email=email, password=encoded_password, **extra_fields)
+        using = self._db or router.db_for_write(self.model, instance=user)
+        # the directory row of a sharded user is inserted on default by a signal, committing
+        # default after the shard means a failed user insert never leaves it behind
+        with transaction.atomic(using=DEFAULT_DB_ALIAS) if is_sharded() else nullcontext():
+            with transaction.atomic(using=using):
+                user.save(using=using)
 
         return user
 
+    def _create_user(self, email, password, **extra_fields):
+        # hash before opening the transaction so the user row is inserted once, with its password
+        return self._insert_user(email, make_password(password), **extra_fields)
+
     def create_user(self, email, password=None, **extra_fields):
         extra_fields.setdefault("is_staff", False)
         extra_fields.setdefault("is_superuser", False)
         return self._create_user(email, password, **extra_fields)
 
+    async def acreate_user(self, email, password=None, **extra_fields):
+        extra_fields.setdefault("is_staff", False)
+        extra_fields.setdefault("is_superuser", False)
+        encoded_password = await arun_hashing(make_password, password)
+        return await sync_to_async(self._insert_user)(email, encoded_password, **extra_fields)
+
     def create_superuser(self, email, password=None, **extra_fields):
         extra_fields.setdefault("is_active", True)
         extra_fields.setdefault("is_confirmed", True)
@@ -1,13 +1,13 @@
 import pyotp
 from django.db import models
-from django.core.mail import EmailMessage
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin
 from django.utils.translation import gettext_lazy as _
-from rest_framework_simplejwt.tokens import RefreshToken
-from app.core.models import UUIDModel, TimeStampedModel, OTPSecretModel
+from app.core.constants import otp_interval
+from app.core.models import UUIDModel, TimeStampedModel, OTPSecretModel, OutgoingEmail
 from app.core.validators import validate_zip_code
 from .managers import UserManager
+from .otp import get_otp_store
 
 
 class User(UUIDModel, AbstractBaseUser, PermissionsMixin, OTPSecretModel, TimeStampedModel):
@@ -45,6 +45,7 @@ class User(UUIDModel, AbstractBaseUser, PermissionsMixin, OTPSecretModel, TimeSt
         verbose_name = _("user")
         verbose_name_plural = _("users")
         ordering = ["-date_created"]
+        indexes = [models.Index(fields=["date_created", "pkid"], name="user_created_keyset_idx")]
 
     def __str__(self) -> str:
         return self.email
@@ -55,6 +56,16 @@ class User(UUIDModel, AbstractBaseUser, PermissionsMixin, OTPSecretModel, TimeSt
             self.secret_keys = new_keys
         super().save(*args, **kwargs)
 
+    @property
+    def is_profile_confirmed(self) -> bool:
+        """
+        Return whether the user profile is confirmed, using the value cached by
+        authentication when present to avoid loading the profile.
+        """
+        if hasattr(self, "profile_confirmed"):
+            return bool(self.profile_confirmed)
+        return self.profile.is_confirmed
+
     @property
     def full_name(self) -> str:
         """
@@ -68,23 +79,19 @@ class User(UUIDModel, AbstractBaseUser, PermissionsMixin, OTPSecretModel, TimeSt
         return full_name.strip()
 
     def tokens(self):
-        refresh = RefreshToken.for_user(self)
-        return {"refresh": str(refresh), "access": str(refresh.access_token)}
+        from .tokens import issue_tokens
+
+        return issue_tokens(self)
 
     def send_email(self, subject, msg):
-        """Send emails with no attachment"""
-        email = EmailMessage(subject=subject, body=msg, to=[self.email])
-        email.send()
+        """Queue emails with no attachment in the outbox"""
+        OutgoingEmail.objects.enqueue(subject=subject, body=msg, to=[self.email])
 
     def generate_otp(self, purpose: str) -> str:
-        try:
-            self.secret_keys[purpose]
-        except:
-            self.create_all_sk()
-        purpose_sk = self.secret_keys[purpose]
-        otp = pyotp.TOTP(purpose_sk, interval=300)  # Ensure the interval passed here is the same during verification
+        purpose_sk = self.get_sk(purpose)
+        otp = pyotp.TOTP(purpose_sk, interval=otp_interval)
         otp_code = otp.now()
-        UserOTP.objects.create(user=self, purpose=purpose, code=otp_code)
+        get_otp_store().save(self, purpose, otp_code)
 
         return otp_code
 
@@ -144,6 +151,7 @@ class UserProfile(UUIDModel, TimeStampedModel):
         verbose_name = _("User Profile")
         verbose_name_plural = _("User Profiles")
         ordering = ["-date_created"]
+        indexes = [models.Index(fields=["date_created", "pkid"], name="profile_created_keyset_idx")]
 
     @property
     def full_name(self) -> str:
@@ -156,6 +164,22 @@ class UserProfile(UUIDModel, TimeStampedModel):
             return f"{self.business}'s Profile"
         return f"{self.user.full_name}'s Profile"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def get_changed_fields(self) -> list:
+        """
+        Return the names of the fields changed since the profile was loaded,
+        or every field if the profile has not been saved yet.
+        """
+        loaded_values = getattr(self, "_loaded_values", None)
+        if loaded_values is None:
+            return [field.attname for field in self._meta.concrete_fields if not field.primary_key]
+        return [name for name, value in loaded_values.items() if getattr(self, name) != value]
+
     def clean(self):
         """
         Model validation to ensure business and business_id are not blank if type is BUSINESS.
@@ -166,8 +190,10 @@ class UserProfile(UUIDModel, TimeStampedModel):
             raise ValidationError({"business_id": "This field is required for business account"})
 
     def save(self, *args, **kwargs):
-        self.full_clean()
+        # uniqueness and the user relation are enforced by the database, validating them here costs extra queries
+        self.full_clean(exclude=["user"], validate_unique=False)
         super().save(*args, **kwargs)
+        self._loaded_values = {field.attname: getattr(self, field.attname) for field in self._meta.concrete_fields}
 
 
 class UserOTP(TimeStampedModel):
@@ -189,6 +215,28 @@ class UserOTP(TimeStampedModel):
         verbose_name = _("User OTP")
         verbose_name_plural = _("User OTP")
         ordering = ["-date_created"]
+        indexes = [
+            models.Index(fields=["date_created", "id"], name="otp_created_keyset_idx"),
+            models.Index(fields=["user", "purpose", "date_created"], name="otp_user_purpose_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.user.id}"
+
+
+class UserDirectory(TimeStampedModel):
+    """
+    A class mapping the email and id of each user to the database shard holding
+    its rows, kept on the default database. Only used when `USER_SHARDS` is set.
+    """
+
+    email = models.EmailField(_("email address"), unique=True)
+    user_id = models.UUIDField(_("user id"), unique=True)
+    shard = models.CharField(_("shard"), max_length=100)
+
+    class Meta:
+        verbose_name = _("User Directory")
+        verbose_name_plural = _("User Directory")
+
+    def __str__(self) -> str:
+        return f"{self.email} ({self.shard})"
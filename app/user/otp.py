@@ -0,0 +1,93 @@
+"""
+This file contains the stores used to keep and verify OTP codes sent to users
+"""
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import router
+from django.db.models import Subquery
+from django.utils.module_loading import import_string
+from app.core.constants import otp_interval
+
+
+class BaseOTPStore:
+    """
+    Base class for OTP stores. A store keeps the latest code of a user for a purpose
+    and consumes it on successful verification.
+    """
+
+    def save(self, user, purpose: str, code: str) -> None:
+        raise NotImplementedError
+
+    def verify(self, user, purpose: str, code: str) -> bool:
+        raise NotImplementedError
+
+    async def averify(self, user, purpose: str, code: str) -> bool:
+        return await sync_to_async(self.verify)(user, purpose, code)
+
+
+class DatabaseOTPStore(BaseOTPStore):
+    """
+    OTP store keeping codes in the `UserOTP` table. Verification is a single UPDATE
+    marking the latest code of the user for the purpose as verified if it matches,
+    expiry is left to the TOTP check.
+    """
+
+    # looked up by label, the user models import this module
+    model_label = "user.UserOTP"
+
+    def get_model(self):
+        return apps.get_model(self.model_label)
+
+    def save(self, user, purpose: str, code: str) -> None:
+        self.get_model().objects.create(user=user, purpose=purpose, code=code)
+
+    def get_unverified_otp(self, user, purpose: str, code: str):
+        model = self.get_model()
+        # the OTPs of a user are on the database holding the user, see app.user.sharding
+        otps = model.objects.using(router.db_for_write(model, instance=user))
+        latest_otp = otps.filter(user=user, purpose=purpose).order_by("-date_created").values("pk")[:1]
+        return otps.filter(pk=Subquery(latest_otp), code=code, is_verified=False)
+
+    def verify(self, user, purpose: str, code: str) -> bool:
+        return self.get_unverified_otp(user, purpose, code).update(is_verified=True) == 1
+
+    async def averify(self, user, purpose: str, code: str) -> bool:
+        return await self.get_unverified_otp(user, purpose, code).aupdate(is_verified=True) == 1
+
+
+class CacheOTPStore(BaseOTPStore):
+    """
+    OTP store keeping the latest code of a user for a purpose in the cache,
+    expiring after the OTP interval.
+    """
+
+    def cache_key(self, user, purpose: str) -> str:
+        return f"otp:{user.id}:{purpose}"
+
+    def save(self, user, purpose: str, code: str) -> None:
+        cache.set(self.cache_key(user, purpose), code, otp_interval)
+
+    def verify(self, user, purpose: str, code: str) -> bool:
+        key = self.cache_key(user, purpose)
+        if cache.get(key) != code:
+            return False
+
+        # only the request that removes the key gets to use the code
+        return bool(cache.delete(key))
+
+    async def averify(self, user, purpose: str, code: str) -> bool:
+        key = self.cache_key(user, purpose)
+        if await cache.aget(key) != code:
+            return False
+
+        return bool(await cache.adelete(key))
+
+
+def get_otp_store() -> BaseOTPStore:
+    """
+    Function to return the OTP store configured in the `OTP_STORE` setting
+    """
+    return import_string(getattr(settings, "OTP_STORE", "app.user.otp.DatabaseOTPStore"))()
@@ -1,20 +1,42 @@
 import pyotp
+from asgiref.sync import sync_to_async
 from django.contrib import auth
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
 from rest_framework.validators import UniqueValidator
 from rest_framework.exceptions import AuthenticationFailed
-from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
-from rest_framework_simplejwt.tokens import RefreshToken, TokenError
-from app.core.constants import otp_purpose
+from rest_framework_simplejwt.tokens import TokenError
+from app.core.constants import otp_interval, otp_purpose
+from app.core.hashers import acheck_password, arun_hashing
+from app.core.serializers import AsyncValidationMixin
 from app.core.validators import validate_name, validate_password_format, validate_zip_code
-from .models import User, UserOTP, UserProfile
+from .models import User, UserDirectory, UserProfile
+from .otp import get_otp_store
+from .sharding import is_sharded
+from .tokens import CachedRefreshToken, aissue_tokens, issue_tokens, revoke_all_tokens
 
 
 # SERIALIZER VALIDATORS
-unique_user_email = UniqueValidator(
-    queryset=User.objects.all(), lookup="iexact", message="A user with this email already exists"
-)
+class UniqueUserEmailValidator(UniqueValidator):
+    """
+    Validator of unique user emails, sharded users are spread over several databases
+    and the user directory holds every email. The queryset is picked on each call
+    since `USER_SHARDS` may change after import, e.g. in tests.
+    """
+
+    def __init__(self):
+        super().__init__(queryset=None, lookup="iexact", message="A user with this email already exists")
+
+    def get_queryset(self):
+        return UserDirectory.objects.all() if is_sharded() else User.objects.all()
+
+    def filter_queryset(self, value, queryset, field_name):
+        return super().filter_queryset(value, self.get_queryset(), field_name)
+
+
+unique_user_email = UniqueUserEmailValidator()
 
 
 class UserOTPSerializer(serializers.Serializer):
@@ -33,20 +55,26 @@ class UserOTPSerializer(serializers.Serializer):
         error_messages={"invalid_choice": "Please use a valid send mode e.g sms or mail"},
     )
 
+    def send_otp(self, user, attrs):
+        """
+        Function to generate the OTP and queue its message in a single transaction
+        """
+        with transaction.atomic():
+            otp_code = user.generate_otp(attrs["otp_mode"])
+
+            subject = "OTP Verification Code for Gezapay"
+            msg = f"Your verification code is {otp_code}"
+
+            if attrs["send_mode"] == "mail":
+                user.send_email(subject, msg)
+            else:
+                user.send_email(subject, msg)  # Change this when the SMS feature is implemented
+
     def validate(self, attrs):
         if not attrs["otp_mode"] in self.keys:
             raise serializers.ValidationError("The OTP mode submitted is not valid")
 
-        user = self.context["request"].user
-        otp_code = user.generate_otp(attrs["otp_mode"])
-
-        subject = "OTP Verification Code for Gezapay"
-        msg = f"Your verification code is {otp_code}"
-
-        if attrs["send_mode"] == "mail":
-            user.send_email(subject, msg)
-        else:
-            user.send_email(subject, msg)  # Change this when the SMS feature is implemented
+        self.send_otp(self.context["request"].user, attrs)
 
         return attrs
 
@@ -81,11 +109,7 @@ class RegisterEmailSerializer(serializers.ModelSerializer):
         return attrs
 
     def create(self, validated_data):
-        user = User.objects.create(email=validated_data["email"])
-        user.set_password(validated_data["password"])
-        user.save()
-
-        return user
+        return User.objects.create_user(email=validated_data["email"], password=validated_data["password"])
 
 
 class RegisterSendSerializer(serializers.Serializer):
@@ -95,11 +119,11 @@ class RegisterSendSerializer(serializers.Serializer):
 
     email = serializers.EmailField(max_length=255, min_length=3, required=True, write_only=True)
 
-    def validate(self, attrs):
-        try:
-            user = User.objects.get(email=attrs["email"])
-            if user.is_confirmed:
-                raise serializers.ValidationError({"email": "This email has already been verified"})
+    def send_otp(self, user):
+        """
+        Function to generate the auth OTP and queue its email in a single transaction
+        """
+        with transaction.atomic():
             otp_code = user.generate_otp("auth")
 
             subject = "OTP Verification Code for Gezapay"
@@ -107,9 +131,15 @@ class RegisterSendSerializer(serializers.Serializer):
 
             user.send_email(subject, message)
 
-        except User.DoesNotExist:
+    def check_user(self, user):
+        if user is None or user.is_confirmed:
             raise serializers.ValidationError({"email": "This email has already been verified"})
 
+    def validate(self, attrs):
+        user = User.objects.by_email(attrs["email"], with_secret_keys=True).first()
+        self.check_user(user)
+        self.send_otp(user)
+
         return attrs
 
 
@@ -128,32 +158,42 @@ class RegisterVerifySerializer(serializers.Serializer):
             "otp_code",
         ]
 
-    def validate(self, attrs):
-        try:
-            user = User.objects.get(email=attrs["email"])
-            if user.is_confirmed:
-                raise serializers.ValidationError({"email": "This email has already been verified"})
-        except User.DoesNotExist:
+    def check_user(self, user):
+        if user is None:
             raise serializers.ValidationError({"email": "User does not exist"})
-        user = User.objects.get(email=attrs["email"])
-        auth_secret_key = user.secret_keys["auth"]
-        recent_otp = UserOTP.objects.filter(purpose="auth").order_by("-date_created").first()
-        if recent_otp:
-            if recent_otp.is_verified == False and recent_otp.code == attrs["otp_code"]:
-                totp = pyotp.TOTP(auth_secret_key, interval=300)
-                if totp.verify(attrs["otp_code"]) == True:
-                    recent_otp.is_verified = True
-                    recent_otp.save()
-                    user.is_confirmed = True
-                    user.is_ = True
-                    user.save()
-                    return attrs
-                else:
-                    raise serializers.ValidationError({"otp_code": "Expired OTP Code"})
-            else:
+        if user.is_confirmed:
+            raise serializers.ValidationError({"email": "This email has already been verified"})
+
+    def validate(self, attrs):
+        user = User.objects.by_email(attrs["email"], with_secret_keys=True).first()
+        self.check_user(user)
+        self.confirm_user(user, attrs["otp_code"])
+
+        return attrs
+
+    def is_totp_valid(self, user, otp_code) -> bool:
+        """
+        Function to check the OTP code has not expired
+        """
+        totp = pyotp.TOTP(user.get_sk("auth"), interval=otp_interval)
+        return totp.verify(otp_code)
+
+    def confirm_user(self, user, otp_code):
+        """
+        Function to check the OTP code, consume it from the OTP store and confirm the user in a
+        single transaction, the code is not consumed if it expired or the user could not be saved
+        """
+        with transaction.atomic(using=user.get_write_db()):
+            # checked first, the store tells an unknown or used code apart from an expired one
+            is_unexpired = self.is_totp_valid(user, otp_code)
+            if not get_otp_store().verify(user, "auth", otp_code):
                 raise serializers.ValidationError({"otp_code": "Invalid OTP Code"})
-        else:
-            raise serializers.ValidationError({"otp_code": "Invalid OTP Code"})
+            if not is_unexpired:
+                raise serializers.ValidationError({"otp_code": "Expired OTP Code"})
+
+            user.is_confirmed = True
+            user.is_ = True
+            user.save()
 
 
 class RegisterInfoSerializer(serializers.ModelSerializer):
@@ -236,9 +276,7 @@ class LoginSerializer(serializers.ModelSerializer):
         ]
 
     def get_tokens(self, obj):
-        user = User.objects.get(email=obj["email"])
-
-        return {"access": user.tokens()["access"], "refresh": user.tokens()["refresh"]}
+        return obj["tokens"]
 
     def validate(self, attrs):
         email = attrs.get("email", "")
@@ -246,18 +284,19 @@ class LoginSerializer(serializers.ModelSerializer):
         user = auth.authenticate(email=email, password=password)
 
         if not user:
-            try:
-                user_email = User.objects.get(email=email)
+            if User.objects.exists_cached(email=email):
                 raise AuthenticationFailed({"message": "Invalid credentials", "password": "Wrong password"})
-            except User.DoesNotExist:
-                raise AuthenticationFailed({"message": "Invalid credentials", "email": "Invalid email"})
+            raise AuthenticationFailed({"message": "Invalid credentials", "email": "Invalid email"})
+        self.check_user(user)
+
+        return {"email": user.email, "tokens": issue_tokens(user)}
+
+    def check_user(self, user):
         if not user.is_confirmed:
             raise AuthenticationFailed({"message": "Email has not been verified", "email": "Unverified User"})
         if not user.is_active:
             raise AuthenticationFailed({"message": "Account has been blocked", "email": "Blocked User"})
 
-        return {"email": user.email, "tokens": user.tokens}
-
 
 class LogoutSerializer(serializers.Serializer):
     """
@@ -277,14 +316,115 @@ class LogoutSerializer(serializers.Serializer):
 
     def validate(self, attrs):
         if attrs["mode"] == "all":
-            user = self.context["request"].user
-            tokens = OutstandingToken.objects.filter(user=user)
-            for token in tokens:
-                t, _ = BlacklistedToken.objects.get_or_create(token=token)
+            revoke_all_tokens(self.context["request"].user)
         else:
             try:
-                RefreshToken(attrs["refresh"]).blacklist()
+                CachedRefreshToken(attrs["refresh"]).blacklist()
             except TokenError:
                 raise serializers.ValidationError({"refresh_token": "Token is invalid or expired"})
 
         return attrs
+
+
+class UserListSerializer(serializers.ModelSerializer):
+    """
+    Model serializer for the rows of the user list
+    """
+
+    class Meta:
+        model = User
+        fields = [
+            "id",
+            "email",
+            "is_active",
+            "is_confirmed",
+            "date_created",
+        ]
+
+
+# ASYNC SERIALIZERS
+class AsyncUserOTPSerializer(AsyncValidationMixin, UserOTPSerializer):
+    """
+    Async counterpart of `UserOTPSerializer`
+    """
+
+    async def avalidate(self, attrs):
+        if not attrs["otp_mode"] in self.keys:
+            raise serializers.ValidationError("The OTP mode submitted is not valid")
+
+        # the OTP and its email are written in one transaction, which needs a sync connection
+        await sync_to_async(self.send_otp)(self.context["request"].user, attrs)
+
+        return attrs
+
+
+class AsyncRegisterEmailSerializer(AsyncValidationMixin, RegisterEmailSerializer):
+    """
+    Async counterpart of `RegisterEmailSerializer`, the email uniqueness is checked in `avalidate`
+    """
+
+    email = serializers.EmailField(max_length=255, min_length=3, required=True)
+
+    async def avalidate(self, attrs):
+        attrs = self.validate(attrs)
+        if await unique_user_email.get_queryset().filter(email__iexact=attrs["email"]).aexists():
+            raise serializers.ValidationError({"email": unique_user_email.message})
+
+        return attrs
+
+    async def asave(self):
+        self.instance = await User.objects.acreate_user(
+            email=self.validated_data["email"], password=self.validated_data["password"]
+        )
+
+        return self.instance
+
+
+class AsyncRegisterSendSerializer(AsyncValidationMixin, RegisterSendSerializer):
+    """
+    Async counterpart of `RegisterSendSerializer`
+    """
+
+    async def avalidate(self, attrs):
+        users = await User.objects.aby_email(attrs["email"], with_secret_keys=True)
+        user = await users.afirst()
+        self.check_user(user)
+        await sync_to_async(self.send_otp)(user)
+
+        return attrs
+
+
+class AsyncRegisterVerifySerializer(AsyncValidationMixin, RegisterVerifySerializer):
+    """
+    Async counterpart of `RegisterVerifySerializer`
+    """
+
+    async def avalidate(self, attrs):
+        users = await User.objects.aby_email(attrs["email"], with_secret_keys=True)
+        user = await users.afirst()
+        self.check_user(user)
+        # the check, consumption and save share a transaction, which needs a sync connection
+        await sync_to_async(self.confirm_user)(user, attrs["otp_code"])
+
+        return attrs
+
+
+class AsyncLoginSerializer(AsyncValidationMixin, LoginSerializer):
+    """
+    Async counterpart of `LoginSerializer`, password hashing runs on the bounded hashing executor
+    """
+
+    async def avalidate(self, attrs):
+        email = attrs.get("email", "")
+        password = attrs.get("password", "")
+
+        user = await (await User.objects.aby_email(email)).afirst()
+        if user is None:
+            # hash anyway so unknown emails take as long as wrong passwords
+            await arun_hashing(make_password, password)
+            raise AuthenticationFailed({"message": "Invalid credentials", "email": "Invalid email"})
+        if not await acheck_password(user, password) or not user.is_active:
+            raise AuthenticationFailed({"message": "Invalid credentials", "password": "Wrong password"})
+        self.check_user(user)
+
+        return {"email": user.email, "tokens": await aissue_tokens(user)}
@@ -0,0 +1,102 @@
+"""
+This file contains the helpers placing users on the database shards listed in `USER_SHARDS`.
+A user, its profile, OTPs and tokens live on the same shard, picked by hashing the user
+`id`. `UserDirectory`, kept on the default database, maps each email and id to its shard.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from uuid import UUID
+
+from django.conf import settings
+from app.core.cache import cached
+
+
+_current_shard = ContextVar("user_shard", default=None)
+
+
+def user_shards() -> list:
+    return list(getattr(settings, "USER_SHARDS", []))
+
+
+def is_sharded() -> bool:
+    return bool(getattr(settings, "USER_SHARDS", []))
+
+
+def _jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash, appending a shard only moves about 1/N of the users
+    """
+    bucket, jump = -1, 0
+    while jump < buckets:
+        bucket = jump
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        jump = int((bucket + 1) * ((1 << 31) / ((key >> 33) + 1)))
+
+    return bucket
+
+
+def placement_shard(user_id):
+    """
+    Function to return the shard a user belongs on, or None when users are not sharded
+    """
+    shards = user_shards()
+    if not shards:
+        return None
+    if not isinstance(user_id, UUID):
+        user_id = UUID(str(user_id))
+
+    return shards[_jump_hash(user_id.int & 0xFFFFFFFFFFFFFFFF, len(shards))]
+
+
+def directory_cache_key(field, value) -> str:
+    return f"user:shard:{field}:{value}"
+
+
+# misses are not cached, a user created on another worker must be found at once
+@cached(directory_cache_key, cache_none=False)
+def _lookup_shard(field, value):
+    from .models import UserDirectory
+
+    return UserDirectory.objects.filter(**{field: value}).values_list("shard", flat=True).first()
+
+
+def shard_for_email(email):
+    """
+    Function to return the shard holding the user with this email, or None when unknown
+    """
+    if not is_sharded():
+        return None
+    return _lookup_shard("email", email)
+
+
+def shard_for_user_id(user_id):
+    """
+    Function to return the shard holding the user with this id, users missing from the
+    directory are looked up on their placement shard
+    """
+    if not is_sharded() or user_id is None:
+        return None
+    return _lookup_shard("user_id", user_id) or placement_shard(user_id)
+
+
+def invalidate_directory(email, user_id) -> None:
+    _lookup_shard.invalidate("email", email)
+    _lookup_shard.invalidate("user_id", user_id)
+
+
+def get_current_shard():
+    return _current_shard.get()
+
+
+@contextmanager
+def use_shard(alias):
+    """
+    Context manager routing the queries on sharded models without an instance to route
+    by, e.g. filters or third party code, to the given shard
+    """
+    token = _current_shard.set(alias)
+    try:
+        yield
+    finally:
+        _current_shard.reset(token)
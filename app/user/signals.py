@@ -1,17 +1,73 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken
 
-from .models import User, UserProfile
+from .authentication import invalidate_user_snapshot
+from .models import User, UserDirectory, UserProfile
+from .sharding import invalidate_directory, is_sharded
+from .tokens import mark_revoked
 
 
 @receiver(post_save, sender=User)
 def create_profile(sender, instance, created, **kwargs):
     """Signal to create user profile when a new user is created"""
     if created:
-        UserProfile.objects.create(user=instance)
+        UserProfile.objects.using(instance._state.db).create(user=instance)
 
 
 @receiver(post_save, sender=User)
-def save_profile(sender, instance, **kwargs):
-    """Signal to save user profile when a new user is created"""
-    instance.profile.save()
+def save_profile(sender, instance, created, **kwargs):
+    """Signal to save changes made to the user profile through the user instance"""
+    if created or not User.profile.is_cached(instance):
+        return
+
+    changed_fields = instance.profile.get_changed_fields()
+    if changed_fields:
+        instance.profile.save(update_fields=changed_fields)
+
+
+@receiver([post_save, post_delete], sender=User)
+def clear_user_snapshot(sender, instance, **kwargs):
+    """Signal to invalidate the cached authentication snapshot and lookups of created, changed or deleted users"""
+    invalidate_user_snapshot(instance.id)
+    User.objects.invalidate_cached(instance)
+
+
+@receiver([post_save, post_delete], sender=UserProfile)
+def clear_profile_snapshot(sender, instance, **kwargs):
+    """Signal to invalidate the cached authentication snapshot when a user profile changes"""
+    invalidate_user_snapshot(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def update_user_directory(sender, instance, created, raw=False, **kwargs):
+    """Signal to record the shard and email of sharded users in the user directory"""
+    if not is_sharded() or raw:
+        return
+
+    if created:
+        UserDirectory.objects.create(email=instance.email, user_id=instance.id, shard=instance._state.db)
+    else:
+        UserDirectory.objects.filter(user_id=instance.id).exclude(email=instance.email).update(email=instance.email)
+    invalidate_directory(instance.email, instance.id)
+
+
+@receiver(post_delete, sender=User)
+def remove_user_directory(sender, instance, **kwargs):
+    """Signal to remove deleted sharded users from the user directory"""
+    if not is_sharded():
+        return
+
+    UserDirectory.objects.filter(user_id=instance.id, shard=instance._state.db).delete()
+    invalidate_directory(instance.email, instance.id)
+
+
+@receiver(post_save, sender=BlacklistedToken)
+def cache_token_revocation(sender, instance, created, **kwargs):
+    """
+    Signal to record tokens blacklisted outside `CachedRefreshToken`, e.g. in the admin, in the
+    revocation caches. Other workers see it once their in-process entry expires.
+    """
+    if created:
+        mark_revoked([instance.token.jti])
+
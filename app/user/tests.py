@@ -1,3 +1,531 @@
-from django.test import TestCase
+import json
+import tempfile
+import threading
+import time
+import uuid
+from unittest import mock
 
-# Create your tests here.
+import pyotp
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.hashers import identify_hasher
+from django.core.cache import cache
+from django.contrib.auth.models import Group
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection
+from django.db.models.signals import post_save
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from app.core.cache import TieredCache, tiered_cache
+from app.core.constants import otp_interval
+from app.core.hashers import BoundedPBKDF2PasswordHasher
+from app.core.permissions import IsFullyGrantedPermission
+from .authentication import CachedJWTAuthentication
+from .management.commands.import_users import Command as ImportUsersCommand
+from .models import User, UserDirectory, UserOTP, UserProfile
+from .otp import get_otp_store
+from .serializers import (
+    AsyncRegisterVerifySerializer,
+    LoginSerializer,
+    RegisterEmailSerializer,
+    RegisterVerifySerializer,
+)
+from .sharding import placement_shard, shard_for_email
+from .tokens import CachedRefreshToken, _take_outstanding_batch, issue_tokens, is_token_revoked, revoke_all_tokens
+
+
+class PasswordHasherTests(TestCase):
+    def test_passwords_are_checked_by_the_bounded_hasher(self):
+        user = User.objects.create_user(email="hasher@example.com", password="a-long-password")
+
+        self.assertIsInstance(identify_hasher(user.password), BoundedPBKDF2PasswordHasher)
+        self.assertTrue(user.check_password("a-long-password"))
+
+
+class UserQueryCountTests(TestCase):
+    def test_create_user_inserts_each_row_once(self):
+        # savepoint, user INSERT, profile INSERT, release
+        with self.assertNumQueries(4):
+            User.objects.create_user(email="count@example.com", password="a-long-password")
+
+    def test_user_save_skips_the_unloaded_profile(self):
+        user = User.objects.create_user(email="count@example.com", password="a-long-password")
+        user = User.objects.get(pk=user.pk)
+
+        with self.assertNumQueries(1):
+            user.save()
+
+    def test_user_save_skips_the_unchanged_profile(self):
+        user = User.objects.create_user(email="count@example.com", password="a-long-password")
+        user = User.objects.select_related("profile").get(pk=user.pk)
+
+        with self.assertNumQueries(1):
+            user.save()
+
+    def test_user_save_updates_only_the_changed_profile_fields(self):
+        user = User.objects.create_user(email="count@example.com", password="a-long-password")
+        user = User.objects.select_related("profile").get(pk=user.pk)
+        user.profile.first_name = "Ada"
+
+        with self.assertNumQueries(2):
+            user.save()
+
+        self.assertEqual(UserProfile.objects.get(user=user).first_name, "Ada")
+
+
+class SecretKeyUpdateTests(TransactionTestCase):
+    def test_concurrent_updates_of_different_purposes_keep_both_keys(self):
+        user = User.objects.create_user(email="keys@example.com", password="a-long-password")
+        barrier = threading.Barrier(2)
+        new_keys, errors = {}, []
+
+        def modify(purpose):
+            try:
+                # each thread holds the keys as loaded before either update
+                instance = User.objects.with_secret_keys().get(pk=user.pk)
+                barrier.wait(timeout=5)
+                new_keys[purpose] = instance.modify_sk(purpose)[purpose]
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=modify, args=(purpose,)) for purpose in ("auth", "reset_password")]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        secret_keys = User.objects.with_secret_keys().get(pk=user.pk).secret_keys
+        self.assertEqual(secret_keys["auth"], new_keys["auth"])
+        self.assertEqual(secret_keys["reset_password"], new_keys["reset_password"])
+        self.assertEqual(secret_keys["transactions"], user.secret_keys["transactions"])
+
+
+@override_settings(OTP_SECRET_MODE="derived", OTP_MASTER_KEY="an-otp-master-key")
+class DerivedSecretKeyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="derived@example.com", password="a-long-password")
+
+    def verify(self, otp_code):
+        serializer = RegisterVerifySerializer(data={"email": self.user.email, "otp_code": otp_code})
+        serializer.is_valid()
+        self.user.refresh_from_db()
+        return serializer.errors
+
+    def test_no_secret_keys_are_stored(self):
+        self.assertTrue(User.uses_derived_sk())
+        self.assertEqual(self.user.initiate_all_sk(), {})
+        self.assertEqual(User.objects.with_secret_keys().get(pk=self.user.pk).secret_keys, {})
+
+    def test_derived_codes_verify(self):
+        errors = self.verify(self.user.generate_otp("auth"))
+
+        self.assertEqual(errors, {})
+        self.assertTrue(self.user.is_confirmed)
+        self.assertEqual(User.objects.with_secret_keys().get(pk=self.user.pk).secret_keys, {})
+
+    def test_secret_keys_differ_per_user_and_purpose(self):
+        other = User.objects.create_user(email="other@example.com", password="a-long-password")
+
+        self.assertEqual(self.user.get_sk("auth"), User.objects.get(pk=self.user.pk).derive_sk("auth"))
+        self.assertNotEqual(self.user.get_sk("auth"), other.get_sk("auth"))
+        self.assertNotEqual(self.user.get_sk("auth"), self.user.get_sk("reset_password"))
+
+    def test_rotation_invalidates_old_codes(self):
+        code = self.user.generate_otp("auth")
+        reset_password_key = self.user.get_sk("reset_password")
+
+        with override_settings(OTP_SECRET_ROTATIONS={"auth": 1, "reset_password": 0}):
+            # the code is still stored, it no longer matches the rotated secret key
+            self.assertEqual(self.verify(code)["otp_code"], ["Expired OTP Code"])
+            self.assertFalse(self.user.is_confirmed)
+            self.assertEqual(self.user.get_sk("reset_password"), reset_password_key)
+
+            self.assertEqual(self.verify(self.user.generate_otp("auth")), {})
+
+    def test_master_key_falls_back_to_the_secret_key(self):
+        with override_settings(OTP_MASTER_KEY=None):
+            fallback_key = self.user.derive_sk("auth")
+        with override_settings(OTP_MASTER_KEY=settings.SECRET_KEY):
+            self.assertEqual(self.user.derive_sk("auth"), fallback_key)
+
+        self.assertNotEqual(self.user.derive_sk("auth"), fallback_key)
+
+
+class RegisterVerifyTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email="verify@example.com", password="a-long-password")
+
+    def verify(self, otp_code, serializer_class=RegisterVerifySerializer):
+        serializer = serializer_class(data={"email": self.user.email, "otp_code": otp_code})
+        if serializer_class is AsyncRegisterVerifySerializer:
+            async_to_sync(serializer.ais_valid)()
+        else:
+            serializer.is_valid()
+        self.user.refresh_from_db()
+        return serializer.errors
+
+    def test_valid_code_confirms_the_user(self):
+        errors = self.verify(self.user.generate_otp("auth"))
+
+        self.assertEqual(errors, {})
+        self.assertTrue(self.user.is_confirmed)
+        self.assertTrue(UserOTP.objects.get().is_verified)
+
+    def test_async_verification_confirms_the_user(self):
+        errors = self.verify(self.user.generate_otp("auth"), AsyncRegisterVerifySerializer)
+
+        self.assertEqual(errors, {})
+        self.assertTrue(self.user.is_confirmed)
+
+    @override_settings(USER_SHARDS=["default"])
+    def test_async_verification_looks_the_shard_up_off_the_event_loop(self):
+        cache.clear()
+        tiered_cache.local.clear()
+
+        errors = self.verify(self.user.generate_otp("auth"), AsyncRegisterVerifySerializer)
+
+        self.assertEqual(errors, {})
+        self.assertTrue(self.user.is_confirmed)
+
+    def test_async_verification_of_an_unknown_email_is_rejected(self):
+        serializer = AsyncRegisterVerifySerializer(data={"email": "nobody@example.com", "otp_code": "123456"})
+
+        self.assertFalse(async_to_sync(serializer.ais_valid)())
+        self.assertEqual(serializer.errors["email"], ["User does not exist"])
+
+    def test_unknown_code_is_invalid(self):
+        code = self.user.generate_otp("auth")
+        errors = self.verify(str((int(code) + 1) % 1000000).zfill(6))
+
+        self.assertEqual(errors["otp_code"], ["Invalid OTP Code"])
+        self.assertFalse(self.user.is_confirmed)
+
+    def test_expired_code_is_not_consumed(self):
+        user = User.objects.with_secret_keys().get(pk=self.user.pk)
+        code = pyotp.TOTP(user.get_sk("auth"), interval=otp_interval).at(time.time() - 10 * otp_interval)
+        get_otp_store().save(user, "auth", code)
+
+        errors = self.verify(code)
+
+        self.assertEqual(errors["otp_code"], ["Expired OTP Code"])
+        self.assertFalse(self.user.is_confirmed)
+        self.assertFalse(UserOTP.objects.get().is_verified)
+
+
+class TokenRevocationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email="tokens@example.com", password="a-long-password", is_active=True)
+
+    def test_tokens_blacklisted_outside_the_cached_token_are_seen(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.assertFalse(is_token_revoked(refresh["jti"], self.user.id))
+
+        RefreshToken(str(refresh)).blacklist()
+
+        self.assertTrue(is_token_revoked(refresh["jti"], self.user.id))
+        with self.assertRaises(TokenError):
+            CachedRefreshToken(str(refresh))
+
+    def test_revocations_in_another_worker_are_seen(self):
+        refresh = RefreshToken.for_user(self.user)
+        # each worker has its own in-process tier in front of the shared cache
+        other_worker = TieredCache(local_timeout=5)
+        with mock.patch("app.user.tokens._revocations", other_worker):
+            self.assertFalse(is_token_revoked(refresh["jti"], self.user.id))
+
+        CachedRefreshToken(str(refresh)).blacklist()
+
+        with mock.patch("app.user.tokens._revocations", other_worker):
+            self.assertTrue(is_token_revoked(refresh["jti"], self.user.id))
+
+    @override_settings(TOKEN_OUTSTANDING_BATCH_SIZE=50, TOKEN_OUTSTANDING_FLUSH_SECONDS=3600)
+    def test_revoking_all_tokens_covers_tokens_buffered_in_other_workers(self):
+        tokens = issue_tokens(self.user)
+        # the row sits in another worker's buffer, or was lost with it
+        self.assertEqual(len(_take_outstanding_batch()), 1)
+
+        revoke_all_tokens(self.user)
+
+        with self.assertRaises(TokenError):
+            CachedRefreshToken(tokens["refresh"])
+
+
+class CachedLookupTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tiered_cache.local.clear()
+        self.user = User.objects.create_user(email="lookup@example.com", password="a-long-password")
+
+    def test_only_the_primary_key_is_cached(self):
+        self.assertEqual(User.objects.get_cached(email=self.user.email), self.user)
+
+        self.assertEqual(cache.get(User.objects.cached_lookup_key("email", self.user.email)), self.user.pk)
+
+    def test_failed_logins_do_not_cache_unknown_emails(self):
+        serializer = LoginSerializer(data={"email": "unknown@example.com", "password": "a-long-password"})
+
+        with self.assertRaises(AuthenticationFailed):
+            serializer.is_valid()
+
+        self.assertIsNone(cache.get(User.objects.cached_lookup_key("email", "unknown@example.com")))
+
+    def test_users_created_after_a_miss_are_found(self):
+        self.assertFalse(User.objects.exists_cached(email="late@example.com"))
+        User.objects.create_user(email="late@example.com", password="a-long-password")
+
+        self.assertTrue(User.objects.exists_cached(email="late@example.com"))
+
+    def test_stale_primary_keys_are_looked_up_again(self):
+        other = User.objects.create_user(email="other@example.com", password="a-long-password")
+        cache.set(User.objects.cached_lookup_key("email", self.user.email), other.pk)
+
+        self.assertEqual(User.objects.get_cached(email=self.user.email), self.user)
+
+
+class CachedJWTAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(
+            email="auth@example.com", password="a-long-password", is_active=True, is_confirmed=True
+        )
+        UserProfile.objects.filter(user=self.user).update(is_confirmed=True)
+
+    def authenticate(self):
+        request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+        user, _ = CachedJWTAuthentication().authenticate(request)
+        request.user = user
+        return request
+
+    def test_warm_snapshot_authenticates_without_queries(self):
+        self.authenticate()
+
+        with self.assertNumQueries(0):
+            request = self.authenticate()
+            self.assertTrue(IsFullyGrantedPermission().has_permission(request, None))
+            self.assertEqual(
+                [getattr(request.user, name) for name in CachedJWTAuthentication.snapshot_fields],
+                [getattr(self.user, name) for name in CachedJWTAuthentication.snapshot_fields],
+            )
+
+    def test_deactivation_in_another_worker_is_seen(self):
+        this_worker = TieredCache(local_timeout=60)
+        with mock.patch("app.user.authentication.tiered_cache", this_worker):
+            self.authenticate()
+
+        # saved in another worker, which clears the shared tier and its own in-process tier
+        self.user.is_active = False
+        self.user.save()
+
+        with mock.patch("app.user.authentication.tiered_cache", this_worker):
+            with self.assertRaises(AuthenticationFailed):
+                self.authenticate()
+
+    def test_password_changes_reject_older_tokens(self):
+        # simplejwt rebinds its settings object on setting_changed, the imported one is patched instead
+        with mock.patch.object(api_settings, "CHECK_REVOKE_TOKEN", True):
+            request = RequestFactory().get("/", HTTP_AUTHORIZATION=f"Bearer {AccessToken.for_user(self.user)}")
+            self.assertEqual(CachedJWTAuthentication().authenticate(request)[0], self.user)
+
+            self.user.set_password("another-long-password")
+            self.user.save()
+
+            with self.assertRaises(AuthenticationFailed):
+                CachedJWTAuthentication().authenticate(request)
+
+    def test_snapshot_is_invalidated_by_profile_saves(self):
+        self.authenticate()
+        profile = UserProfile.objects.get(user=self.user)
+        profile.is_confirmed = False
+        profile.save()
+
+        self.assertFalse(IsFullyGrantedPermission().has_permission(self.authenticate(), None))
+
+
+class UserListViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.staff = User.objects.create_user(
+            email="staff@example.com", password="a-long-password", is_active=True, is_confirmed=True, is_staff=True
+        )
+        self.member = User.objects.create_user(
+            email="member@example.com", password="a-long-password", is_active=True, is_confirmed=True
+        )
+
+    def get(self, user, **params):
+        authorization = f"Bearer {AccessToken.for_user(user)}"
+        return self.client.get(reverse("user:user-list"), params, HTTP_AUTHORIZATION=authorization)
+
+    def test_staff_lists_users_newest_first(self):
+        response = self.get(self.staff)
+
+        self.assertEqual(response.status_code, 200)
+        emails = [row["email"] for row in response.json()["results"]]
+        self.assertEqual(emails, ["member@example.com", "staff@example.com"])
+
+    @override_settings(PAGINATION_STREAM_THRESHOLD=1)
+    def test_large_pages_are_streamed(self):
+        response = self.get(self.staff, limit=2)
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(json.loads(b"".join(response.streaming_content))["results"]), 2)
+
+    def test_other_users_are_forbidden(self):
+        # the envelope reports errors with a 200, see BaseAPIResponseMiddleware
+        data = self.get(self.member).json()
+        self.assertEqual(data["status"], 403)
+        self.assertFalse(data["success"])
+
+
+class ImportUsersTests(TestCase):
+    def import_users(self, *lines):
+        with tempfile.NamedTemporaryFile("w", suffix=".jsonl") as file:
+            file.write("\n".join(lines) + "\n")
+            file.flush()
+            stderr = mock.MagicMock()
+            call_command("import_users", file.name, workers=1, stdout=mock.MagicMock(), stderr=stderr)
+
+        return "".join(call.args[0] for call in stderr.write.call_args_list)
+
+    def row(self, email, password="Alongpassword1!"):
+        return json.dumps({"email": email, "password": password})
+
+    def test_malformed_lines_are_skipped(self):
+        errors = self.import_users(
+            self.row("first@example.com"), "{not json", "[1, 2]", self.row("second@example.com")
+        )
+
+        self.assertIn("line 2", errors)
+        self.assertIn("line 3", errors)
+        self.assertEqual(
+            sorted(User.objects.values_list("email", flat=True)), ["first@example.com", "second@example.com"]
+        )
+        self.assertEqual(UserProfile.objects.count(), 2)
+
+    def test_existing_emails_are_matched_regardless_of_case(self):
+        User.objects.create_user(email="taken@example.com", password="a-long-password")
+
+        self.import_users(self.row("Taken@Example.com"), self.row("TAKEN@example.com"), self.row("new@example.com"))
+
+        emails = sorted(User.objects.values_list("email", flat=True))
+        self.assertEqual(emails, ["new@example.com", "taken@example.com"])
+
+    def test_users_registered_during_the_import_are_skipped(self):
+        get_existing_emails = ImportUsersCommand.get_existing_emails
+
+        def register_concurrently(command, emails):
+            # the first check misses a user registered right after it
+            if not User.objects.filter(email="racer@example.com").exists():
+                User.objects.create_user(email="racer@example.com", password="a-long-password")
+                return set()
+            return get_existing_emails(command, emails)
+
+        with mock.patch.object(ImportUsersCommand, "get_existing_emails", register_concurrently):
+            errors = self.import_users(self.row("racer@example.com"), self.row("other@example.com"))
+
+        self.assertIn("registered during the import", errors)
+        emails = sorted(User.objects.values_list("email", flat=True))
+        self.assertEqual(emails, ["other@example.com", "racer@example.com"])
+        self.assertEqual(UserProfile.objects.count(), 2)
+
+
+@override_settings(USER_SHARDS=["default", "shard_1"])
+class ShardingTests(TestCase):
+    databases = {"default", "shard_1"}
+
+    def setUp(self):
+        cache.clear()
+        tiered_cache.local.clear()
+
+    def user_id_on(self, shard):
+        while True:
+            user_id = uuid.uuid4()
+            if placement_shard(user_id) == shard:
+                return user_id
+
+    def create_user(self, email, shard, **extra_fields):
+        return User.objects.create_user(
+            email=email, password="a-long-password", id=self.user_id_on(shard), **extra_fields
+        )
+
+    def test_users_are_placed_on_their_shard_and_recorded_in_the_directory(self):
+        for shard in ("default", "shard_1"):
+            with self.subTest(shard):
+                email = f"{shard}@example.com"
+                user = self.create_user(email, shard)
+
+                self.assertTrue(User.objects.using(shard).filter(id=user.id).exists())
+                self.assertTrue(UserProfile.objects.using(shard).filter(user_id=user.id).exists())
+                self.assertEqual(UserDirectory.objects.get(email=email).shard, shard)
+                self.assertEqual(User.objects.by_email(email).get(), user)
+
+    def test_failed_shard_inserts_leave_no_directory_row(self):
+        def fail(sender, **kwargs):
+            raise IntegrityError
+
+        # runs after the receiver recording the user in the directory
+        post_save.connect(fail, sender=User)
+        try:
+            with self.assertRaises(IntegrityError):
+                self.create_user("orphan@example.com", "shard_1")
+        finally:
+            post_save.disconnect(fail, sender=User)
+
+        self.assertFalse(UserDirectory.objects.exists())
+        self.assertFalse(User.objects.using("shard_1").exists())
+
+    def test_directory_misses_are_not_cached(self):
+        self.assertIsNone(shard_for_email("late@example.com"))
+        UserDirectory.objects.create(email="late@example.com", user_id=uuid.uuid4(), shard="shard_1")
+
+        self.assertEqual(shard_for_email("late@example.com"), "shard_1")
+
+    def test_emails_are_checked_against_the_directory(self):
+        UserDirectory.objects.create(email="taken@example.com", user_id=uuid.uuid4(), shard="shard_1")
+        data = {"email": "Taken@example.com", "password": "Alongpassword1!", "confirm_password": "Alongpassword1!"}
+
+        serializer = RegisterEmailSerializer(data=data)
+
+        self.assertFalse(serializer.is_valid())
+        self.assertEqual(serializer.errors["email"], ["A user with this email already exists"])
+
+    def rebalance(self):
+        stderr = mock.MagicMock()
+        try:
+            call_command("rebalance_user_shards", stdout=mock.MagicMock(), stderr=stderr)
+        finally:
+            self.errors = "".join(call.args[0] for call in stderr.write.call_args_list)
+
+    def test_rebalance_moves_users_with_their_groups(self):
+        user_id = self.user_id_on("shard_1")
+        Group.objects.using("shard_1").create(name="editors")
+        with override_settings(USER_SHARDS=["default"]):
+            user = User.objects.create_user(email="moved@example.com", password="a-long-password", id=user_id)
+            user.groups.add(Group.objects.create(name="editors"))
+
+        self.rebalance()
+
+        self.assertFalse(User.objects.using("default").filter(id=user_id).exists())
+        moved = User.objects.using("shard_1").get(id=user_id)
+        self.assertEqual(list(moved.groups.values_list("name", flat=True)), ["editors"])
+        self.assertTrue(UserProfile.objects.using("shard_1").filter(user_id=user_id).exists())
+        self.assertEqual(UserDirectory.objects.get(user_id=user_id).shard, "shard_1")
+
+    def test_rebalance_reports_users_whose_groups_are_missing_on_the_target(self):
+        user_id = self.user_id_on("shard_1")
+        with override_settings(USER_SHARDS=["default"]):
+            user = User.objects.create_user(email="stuck@example.com", password="a-long-password", id=user_id)
+            user.groups.add(Group.objects.create(name="editors"))
+
+        with self.assertRaises(CommandError):
+            self.rebalance()
+
+        self.assertIn("group 'editors' does not exist on shard_1", self.errors)
+        self.assertTrue(User.objects.using("default").filter(id=user_id).exists())
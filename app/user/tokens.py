@@ -0,0 +1,218 @@
+"""
+This file contains token revocation helpers for the User App
+"""
+
+import atexit
+import threading
+import time
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import router
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import BlacklistMixin, RefreshToken, TokenError
+from rest_framework_simplejwt.utils import datetime_from_epoch
+from app.core.cache import TieredCache
+from .sharding import shard_for_user_id, use_shard
+
+
+# Revocation lookups, maps the token jti to whether it is revoked
+_revocations = TieredCache(
+    max_size=getattr(settings, "TOKEN_REVOCATION_LOCAL_MAX_SIZE", 10000),
+    local_timeout=getattr(settings, "TOKEN_REVOCATION_LOCAL_TIMEOUT", 5),
+)
+
+# OutstandingToken rows waiting to be inserted, see `TOKEN_OUTSTANDING_BATCH_SIZE`
+_outstanding_buffer = []
+_outstanding_lock = threading.Lock()
+_outstanding_flushed_at = time.monotonic()
+
+
+def _cache_key(jti: str) -> str:
+    return f"token:revoked:{jti}"
+
+
+def _revoked_before_key(user_id) -> str:
+    return f"token:revoked_before:{user_id}"
+
+
+def mark_revoked(jtis) -> None:
+    """
+    Function to record revoked token ids in the shared and in-process caches
+    """
+    keys = [_cache_key(jti) for jti in jtis]
+    timeout = getattr(settings, "TOKEN_REVOCATION_CACHE_TIMEOUT", 300)
+    _revocations.shared.set_many({key: True for key in keys}, timeout)
+    for key in keys:
+        _revocations.local.set(key, True, _revocations.local_timeout)
+
+
+def is_token_revoked(jti: str, user_id=None) -> bool:
+    """
+    Function to check if a token is blacklisted, looking at the in-process cache,
+    then the shared cache and only then the blacklist table of the user's database.
+    Only revocations are kept in the in-process cache, a token found not revoked is
+    checked against the shared cache again so a revocation in another worker is seen.
+    """
+    key = _cache_key(jti)
+    if _revocations.local.get(key):
+        return True
+
+    revoked = _revocations.shared.get(key)
+    if revoked is None:
+        revoked = BlacklistedToken.objects.using(shard_for_user_id(user_id)).filter(token__jti=jti).exists()
+        _revocations.shared.set(key, revoked, getattr(settings, "TOKEN_REVOCATION_CACHE_TIMEOUT", 300))
+    if revoked:
+        _revocations.local.set(key, True, _revocations.local_timeout)
+
+    return revoked
+
+
+def _take_outstanding_batch() -> list:
+    global _outstanding_flushed_at
+
+    with _outstanding_lock:
+        batch = _outstanding_buffer[:]
+        _outstanding_buffer.clear()
+        _outstanding_flushed_at = time.monotonic()
+
+    return batch
+
+
+def _group_by_database(batch) -> dict:
+    # tokens are stored with their user, which may be on different shards
+    groups = defaultdict(list)
+    for outstanding_token in batch:
+        groups[router.db_for_write(OutstandingToken, instance=outstanding_token)].append(outstanding_token)
+
+    return groups
+
+
+def flush_outstanding_tokens() -> None:
+    """
+    Function to insert the buffered OutstandingToken rows in a single query per database
+    """
+    for using, tokens in _group_by_database(_take_outstanding_batch()).items():
+        OutstandingToken.objects.using(using).bulk_create(tokens, ignore_conflicts=True)
+
+
+async def aflush_outstanding_tokens() -> None:
+    """
+    Async counterpart of `flush_outstanding_tokens`
+    """
+    for using, tokens in _group_by_database(_take_outstanding_batch()).items():
+        await OutstandingToken.objects.using(using).abulk_create(tokens, ignore_conflicts=True)
+
+
+atexit.register(flush_outstanding_tokens)
+
+
+def _record_outstanding(outstanding_token) -> bool:
+    """
+    Function to buffer an OutstandingToken row, returns True when the buffer should be flushed
+    """
+    with _outstanding_lock:
+        _outstanding_buffer.append(outstanding_token)
+        is_full = len(_outstanding_buffer) >= getattr(settings, "TOKEN_OUTSTANDING_BATCH_SIZE", 1)
+        is_stale = time.monotonic() - _outstanding_flushed_at >= getattr(
+            settings, "TOKEN_OUTSTANDING_FLUSH_SECONDS", 5
+        )
+
+    return is_full or is_stale
+
+
+def issue_tokens(user) -> dict:
+    """
+    Function to mint a single refresh and access token pair for the user
+    """
+    refresh = CachedRefreshToken.for_user(user)
+    if refresh.flush_outstanding:
+        flush_outstanding_tokens()
+
+    return {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+
+async def aissue_tokens(user) -> dict:
+    """
+    Async counterpart of `issue_tokens`
+    """
+    refresh = CachedRefreshToken.for_user(user)
+    if refresh.flush_outstanding:
+        await aflush_outstanding_tokens()
+
+    return {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+
+def revoke_all_tokens(user) -> int:
+    """
+    Function to blacklist every outstanding token of the user in a single insert.
+    Tokens whose OutstandingToken row is still buffered, in this or another worker,
+    are revoked by the marker checked in `CachedRefreshToken.check_blacklist`.
+    Returns the number of tokens revoked.
+    """
+    _revocations.shared.set(
+        _revoked_before_key(getattr(user, api_settings.USER_ID_FIELD)),
+        int(time.time()),
+        int(api_settings.REFRESH_TOKEN_LIFETIME.total_seconds()),
+    )
+    flush_outstanding_tokens()
+    using = router.db_for_write(OutstandingToken, instance=user)
+    tokens = list(
+        OutstandingToken.objects.using(using)
+        .filter(user=user, blacklistedtoken__isnull=True)
+        .values_list("pk", "jti")
+    )
+    BlacklistedToken.objects.using(using).bulk_create(
+        [BlacklistedToken(token_id=pk) for pk, _ in tokens], ignore_conflicts=True
+    )
+    mark_revoked(jti for _, jti in tokens)
+
+    return len(tokens)
+
+
+class CachedRefreshToken(RefreshToken):
+    """
+    Refresh token checking its blacklist status through the revocation caches.
+    The OutstandingToken row of new tokens is buffered, `flush_outstanding` tells
+    whether the caller should flush the buffer. Rows still buffered when a worker is
+    killed are lost, which only loses the record: tokens issued before a user's last
+    `revoke_all_tokens` are rejected whether or not their row exists.
+    """
+
+    flush_outstanding = False
+
+    @classmethod
+    def for_user(cls, user):
+        # skip BlacklistMixin.for_user, which inserts the OutstandingToken row right away
+        token = super(BlacklistMixin, cls).for_user(user)
+        token.flush_outstanding = _record_outstanding(
+            OutstandingToken(
+                user=user,
+                jti=token[api_settings.JTI_CLAIM],
+                token=str(token),
+                created_at=token.current_time,
+                expires_at=datetime_from_epoch(token["exp"]),
+            )
+        )
+
+        return token
+
+    def check_blacklist(self):
+        user_id = self.payload.get(api_settings.USER_ID_CLAIM)
+        if is_token_revoked(self.payload[api_settings.JTI_CLAIM], user_id):
+            raise TokenError("Token is blacklisted")
+
+        # tokens issued up to the second of the revocation are revoked, the claim has no finer precision
+        revoked_before = _revocations.shared.get(_revoked_before_key(user_id))
+        if revoked_before is not None and self.payload.get("iat", 0) <= revoked_before:
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        # BlacklistMixin.blacklist runs its queries without a user instance to route by
+        with use_shard(shard_for_user_id(self.payload.get(api_settings.USER_ID_CLAIM))):
+            blacklisted_token = super().blacklist()
+        mark_revoked([self.payload[api_settings.JTI_CLAIM]])
+
+        return blacklisted_token
@@ -2,13 +2,28 @@
 URL configuration for the User App
 """
 
+from django.conf import settings
 from django.urls import path
-from .views import RegisterEmailView, RegisterVerifyView, LoginView, RegisterInfoView, LogoutView, GenerateOTPView
+from . import views
+from .views import RegisterInfoView, LogoutView, UserListView
 
 
 app_name = "app.user"
 
+# Async views are served natively under ASGI, see the ASYNC_USER_VIEWS setting
+if settings.ASYNC_USER_VIEWS:
+    RegisterEmailView = views.AsyncRegisterEmailView
+    RegisterVerifyView = views.AsyncRegisterVerifyView
+    LoginView = views.AsyncLoginView
+    GenerateOTPView = views.AsyncGenerateOTPView
+else:
+    RegisterEmailView = views.RegisterEmailView
+    RegisterVerifyView = views.RegisterVerifyView
+    LoginView = views.LoginView
+    GenerateOTPView = views.GenerateOTPView
+
 urlpatterns = [
+    path("", UserListView.as_view(), name="user-list"),
     path("register/", RegisterEmailView.as_view(), name="register-user"),
     path("register/verify/", RegisterVerifyView.as_view(), name="verify-email"),
     path("register/info/", RegisterInfoView.as_view(), name="register-info"),
@@ -1,8 +1,11 @@
 from rest_framework import generics, status
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from app.core.paginator import StreamingListMixin
 from app.core.renderers import DefaultRenderer
+from app.core.views import AsyncGenericAPIView
 from .models import User
+from .sharding import is_sharded, user_shards
 from .serializers import (
     RegisterEmailSerializer,
     RegisterSendSerializer,
@@ -10,7 +13,13 @@ from .serializers import (
     RegisterInfoSerializer,
     LoginSerializer,
     LogoutSerializer,
+    UserListSerializer,
     UserOTPSerializer,
+    AsyncRegisterEmailSerializer,
+    AsyncRegisterSendSerializer,
+    AsyncRegisterVerifySerializer,
+    AsyncLoginSerializer,
+    AsyncUserOTPSerializer,
 )
 
 
@@ -132,3 +141,102 @@ class LogoutView(generics.GenericAPIView):
             {"message": "User logged out successfully"},
             status=status.HTTP_204_NO_CONTENT,
         )
+
+
+class UserListView(StreamingListMixin, generics.ListAPIView):
+    """
+    API view listing users to staff, newest first. Large JSON pages are streamed,
+    sharded deployments pick the shard listed with the `shard` query parameter.
+    """
+
+    serializer_class = UserListSerializer
+    permission_classes = (IsAdminUser,)
+
+    def get_queryset(self):
+        queryset = User.objects.all()
+        if is_sharded():
+            shard = self.request.query_params.get("shard")
+            queryset = queryset.using(shard if shard in user_shards() else user_shards()[0])
+
+        return queryset
+
+
+# ASYNC VIEWS
+class AsyncGenerateOTPView(AsyncGenericAPIView):
+    """
+    Async API view for generating and sending OTP codes when requested to users
+    """
+
+    serializer_class = AsyncUserOTPSerializer
+
+    async def post(self, request):
+        serializer = self.serializer_class(data=request.data, context={"request": request})
+        await serializer.ais_valid(raise_exception=True)
+
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class AsyncRegisterEmailView(AsyncGenericAPIView):
+    """
+    Async API View to Register a user by collecting email and password
+    """
+
+    permission_classes = (AllowAny,)
+    serializer_class = AsyncRegisterEmailSerializer
+
+    async def post(self, request, *args, **kwargs):
+        serializer = self.serializer_class(data=request.data)
+        await serializer.ais_valid(raise_exception=True)
+        await serializer.asave()
+
+        return Response(
+            {"message": "User registered successfully. Kindly verify email to proceed", "result": serializer.data},
+            status=status.HTTP_201_CREATED,
+        )
+
+
+class AsyncRegisterVerifyView(AsyncGenericAPIView):
+    """
+    Async API View to send and confirm OTP codes for user email verification
+    """
+
+    permission_classes = (AllowAny,)
+
+    def get_serializer_class(self):
+        if self.request.method == "GET":
+            return AsyncRegisterSendSerializer
+        return AsyncRegisterVerifySerializer
+
+    async def get(self, request, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        serializer = serializer_class(data=request.query_params)
+        await serializer.ais_valid(raise_exception=True)
+
+        return Response(
+            {"message": "OTP code has been sent to email", "result": serializer.data}, status=status.HTTP_200_OK
+        )
+
+    async def post(self, request, *args, **kwargs):
+        serializer_class = self.get_serializer_class()
+        serializer = serializer_class(data=request.data)
+        await serializer.ais_valid(raise_exception=True)
+
+        return Response({"message": "Email has been confirmed"}, status=status.HTTP_200_OK)
+
+
+class AsyncLoginView(AsyncGenericAPIView):
+    """
+    Async API view to login user and provide auth tokens
+    """
+
+    serializer_class = AsyncLoginSerializer
+    permission_classes = (AllowAny,)
+
+    async def post(self, request):
+        serializer = self.serializer_class(data=request.data)
+        await serializer.ais_valid(raise_exception=True)
+
+        return Response(
+            {"message": "User logged in successfully", "result": serializer.data},
+            status=status.HTTP_200_OK,
+        )
@@ -0,0 +1,57 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+from config.routers import get_pin_state, reset_pin_state, start_pin_state
+
+
+class ReplicaPinMiddleware:
+    """
+    Middleware giving each request its own database pin state for `PrimaryReplicaRouter`.
+    A request that writes sets a cookie pinning the reads of the client's next requests,
+    for `DATABASE_REPLICA_STICKY_SECONDS`, to the primary database so replication lag
+    is never visible to the client that wrote, e.g. between registration and email verification.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        token = start_pin_state(self.is_pinned(request))
+        try:
+            response = self.get_response(request)
+            return self.process_response(request, response)
+        finally:
+            reset_pin_state(token)
+
+    async def __acall__(self, request):
+        token = start_pin_state(self.is_pinned(request))
+        try:
+            response = await self.get_response(request)
+            return self.process_response(request, response)
+        finally:
+            reset_pin_state(token)
+
+    def is_pinned(self, request):
+        return settings.DATABASE_REPLICA_COOKIE in request.COOKIES
+
+    def process_response(self, request, response):
+        if get_pin_state().wrote:
+            response.set_cookie(
+                settings.DATABASE_REPLICA_COOKIE,
+                "1",
+                max_age=settings.DATABASE_REPLICA_STICKY_SECONDS,
+                secure=request.is_secure(),
+                httponly=True,
+                samesite="Lax",
+            )
+
+        return response
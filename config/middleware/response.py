@@ -1,19 +1,47 @@
-import json
-import copy
-
-from django.utils.deprecation import MiddlewareMixin
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
 from django.utils.translation import gettext_lazy as _
-from django.core.serializers.json import DjangoJSONEncoder
 
 from rest_framework import status
 
+from app.core.encoders import json_dumps
+from app.core.metrics import timed
+
 
-class BaseAPIResponseMiddleware(MiddlewareMixin):
+class BaseAPIResponseMiddleware:
     """
     Base class middleware to set custom format of API response. To revert back to
     original custom response, use default response function found in core/wrappers.py
+
+    DRF responses are wrapped in `process_template_response`, before they are rendered,
+    so the envelope is encoded a single time by the negotiated renderer. `process_response`
+    only handles responses that were already rendered when they reached the middleware.
+
+    The middleware is hybrid sync/async, wrapping the envelope is pure CPU work so under
+    ASGI it runs directly on the event loop instead of through a `sync_to_async` thread hop.
     """
 
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django adapts sync hooks with sync_to_async when the handler is async
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        response = self.get_response(request)
+        return self.process_response(request, response)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        return self.process_response(request, response)
+
     def render_response(self, response):
         """
         function to fixed the response API following with this format:
@@ -34,6 +62,7 @@ class BaseAPIResponseMiddleware(MiddlewareMixin):
                "results": [],
 
                "count": 2,
+               "count_type": "exact",
                "page_size": 5,
                "current_page": 1,
                "next": "/api/post/?page=2&search=a",
@@ -56,6 +85,7 @@ class BaseAPIResponseMiddleware(MiddlewareMixin):
             "success",
             "non_field_errors",
             "count",
+            "count_type",
             "page_size",
             "current_page",
             "next",
@@ -63,7 +93,8 @@ class BaseAPIResponseMiddleware(MiddlewareMixin):
             "result",
             "results",
         )
-        response_data = copy.deepcopy(response.data)
+        # a shallow copy is enough, only top level keys are added or removed below
+        response_data = dict(response.data)
 
         # setup default result if doesn't exist
         if not any(["result" in response_data, "results" in response_data]):
@@ -128,21 +159,70 @@ class BaseAPIResponseMiddleware(MiddlewareMixin):
 
         return response_data
 
-    def process_response(self, request, response):
+    def use_default_response(self, request):
+        return bool(request.headers.get("Use-Default-Response"))
+
+    def wrap_response(self, response):
+        """
+        function to replace `response.data` with the formatted response data
+        """
+        response_data = self.render_response(response)
+        response.status_code = response_data.pop("status_http")
+        response.data = response_data
+
+        return response_data
+
+    def encode_response(self, response, response_data):
+        """
+        function to encode the formatted response data with the renderer negotiated by DRF,
+        falling back to JSON for responses without one
+        """
+        renderer = getattr(response, "accepted_renderer", None)
+        if renderer is None:
+            return json_dumps(response_data)
+
+        return renderer.render(response_data, response.accepted_media_type, response.renderer_context)
+
+    def process_template_response(self, request, response):
+        return self.handle_template_response(request, response)
+
+    async def aprocess_template_response(self, request, response):
+        return self.handle_template_response(request, response)
+
+    def handle_template_response(self, request, response):
+        """
+        function to wrap DRF responses in the envelope before they are rendered
+        """
         # use default response if it setup.
-        if request.headers.get("Use-Default-Response"):
+        if self.use_default_response(request):
             return response
 
         if hasattr(response, "data") and isinstance(response.data, dict):
             try:
-                response_data = self.render_response(response)
-                response.status_code = response_data.get("status_http")
+                with timed("envelope"):
+                    self.wrap_response(response)
+                response._envelope_rendered = True
+            except Exception:
+                pass
+
+        return response
 
-                if "status_http" in response_data:
-                    del response_data["status_http"]
+    def process_response(self, request, response):
+        # use default response if it setup.
+        if self.use_default_response(request):
+            return response
 
-                response.data = response_data
-                response.content = json.dumps(response_data, cls=DjangoJSONEncoder)
+        # responses rendered before reaching the middleware still need to be wrapped and re-encoded
+        if (
+            not getattr(response, "_envelope_rendered", False)
+            and hasattr(response, "data")
+            and isinstance(response.data, dict)
+        ):
+            try:
+                with timed("envelope"):
+                    response_data = self.wrap_response(response)
+                    response.content = self.encode_response(response, response_data)
+                response._envelope_rendered = True
             except Exception:
                 pass
 
@@ -158,7 +238,7 @@ class BaseAPIResponseMiddleware(MiddlewareMixin):
             }
             response.status_code = 200
             response.data = response_data
-            response.content = json.dumps(response_data, cls=DjangoJSONEncoder)
+            response.content = json_dumps(response_data)
             response["Content-Type"] = "application/json"
 
         return response
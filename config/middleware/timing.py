@@ -0,0 +1,90 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from app.core.metrics import (
+    get_request_timings,
+    histogram_store,
+    reset_request_timings,
+    start_request_timings,
+)
+
+
+class RequestTimingMiddleware:
+    """
+    Middleware recording the wall time of each request, the count and time of its database
+    queries, the time spent building the response envelope and rendering the response.
+    The timings are sent back in a `Server-Timing` header and added to the per-view
+    histograms served at `/metrics`. Place it first in `MIDDLEWARE` to time the whole chain.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+            # Django adapts sync hooks with sync_to_async when the handler is async
+            self.process_template_response = self.aprocess_template_response
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        token = start_request_timings()
+        try:
+            start = time.perf_counter()
+            response = self.get_response(request)
+            return self.record(request, response, start)
+        finally:
+            reset_request_timings(token)
+
+    async def __acall__(self, request):
+        token = start_request_timings()
+        try:
+            start = time.perf_counter()
+            response = await self.get_response(request)
+            return self.record(request, response, start)
+        finally:
+            reset_request_timings(token)
+
+    def process_template_response(self, request, response):
+        return self.time_rendering(response)
+
+    async def aprocess_template_response(self, request, response):
+        return self.time_rendering(response)
+
+    def time_rendering(self, response):
+        """
+        function to time the rendering that Django runs after the last template response hook
+        """
+        timings = get_request_timings()
+        if timings is not None:
+            start = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: timings.add("render", time.perf_counter() - start))
+
+        return response
+
+    def get_view_name(self, request):
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return "unmatched"
+        return match.view_name or match.route
+
+    def record(self, request, response, start):
+        timings = get_request_timings()
+        timings.add("total", time.perf_counter() - start)
+
+        entries = []
+        for phase, seconds in timings.phases.items():
+            entry = f"{phase};dur={seconds * 1000:.2f}"
+            if phase == "db":
+                entry += f';desc="{timings.db_queries} queries"'
+            entries.append(entry)
+        response["Server-Timing"] = ", ".join(entries)
+
+        histogram_store.observe(self.get_view_name(request), request.method, timings)
+
+        return response
@@ -0,0 +1,155 @@
+"""
+Database routers for the project
+"""
+
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class PinState:
+    """Whether reads of the current request or task are pinned to the primary database"""
+
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+_pin_state = ContextVar("database_pin_state", default=None)
+
+
+def start_pin_state(pinned=False):
+    """
+    Function to give the current request its own pin state, returns the token to reset it with
+    """
+    return _pin_state.set(PinState(pinned))
+
+
+def reset_pin_state(token) -> None:
+    _pin_state.reset(token)
+
+
+def get_pin_state():
+    state = _pin_state.get()
+    if state is None:
+        # outside of a request, e.g. management commands, pin for the rest of the context
+        state = PinState()
+        _pin_state.set(state)
+
+    return state
+
+
+@contextmanager
+def use_primary():
+    """
+    Context manager sending every read inside the block to the primary database
+    """
+    token = start_pin_state(pinned=True)
+    try:
+        yield
+    finally:
+        reset_pin_state(token)
+
+
+class PrimaryReplicaRouter:
+    """
+    Router sending writes to the primary database and reads to one of the
+    `DATABASE_REPLICAS`. Once the current request or task has written, its reads
+    stay on the primary so it reads its own writes; `config.middleware.replica`
+    extends the window to the following requests of the client with a cookie.
+    Reads inside a transaction on the primary also stay on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        # related objects are read from the database of the instance, e.g. the groups of a sharded user
+        instance = hints.get("instance")
+        if instance is not None and instance._state.db:
+            return instance._state.db
+
+        replicas = settings.DATABASE_REPLICAS
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+
+        state = get_pin_state()
+        if state.pinned or state.wrote or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        get_pin_state().wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas are copies of the primary, they are migrated through replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class UserShardRouter:
+    """
+    Router placing users and the rows attached to them on the shard of the user, see
+    `app.user.sharding`. Rows are routed by the instance hint when Django provides one,
+    otherwise by the shard selected with `use_shard`. Other models fall through to the
+    next router. Every shard is migrated with the full schema.
+    """
+
+    sharded_models = {
+        "user.user",
+        "user.user_groups",
+        "user.user_user_permissions",
+        "user.userprofile",
+        "user.userotp",
+        "token_blacklist.outstandingtoken",
+        "token_blacklist.blacklistedtoken",
+    }
+
+    def get_shard(self, model, hints):
+        from app.user.models import User, UserOTP, UserProfile
+        from app.user.sharding import get_current_shard, is_sharded, placement_shard, shard_for_user_id
+
+        if not is_sharded() or model._meta.label_lower not in self.sharded_models:
+            return None
+
+        instance = hints.get("instance")
+        if instance is None:
+            return get_current_shard()
+        if instance._state.db:
+            return instance._state.db
+
+        if isinstance(instance, User):
+            return placement_shard(instance.id)
+        if isinstance(instance, (UserProfile, UserOTP)):
+            user = instance._state.fields_cache.get("user")
+            return user._state.db if user is not None else shard_for_user_id(instance.user_id)
+
+        # outstanding and blacklisted tokens follow the user or token they are created with
+        related = instance._state.fields_cache.get("user") or instance._state.fields_cache.get("token")
+        if related is not None and related._state.db:
+            return related._state.db
+
+        return get_current_shard()
+
+    def db_for_read(self, model, **hints):
+        return self.get_shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self.get_shard(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        if obj1._state.db in settings.USER_SHARDS and obj2._state.db in settings.USER_SHARDS:
+            return obj1._state.db == obj2._state.db
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return None
@@ -9,6 +9,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 from decouple import config
 from django.utils.timezone import timedelta
@@ -43,6 +44,9 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 WSGI_APPLICATION = "config.wsgi.application"
 
+# Serve the async login, registration and OTP views of app.user, for ASGI deployments
+ASYNC_USER_VIEWS = config("ASYNC_USER_VIEWS", default=False, cast=bool)
+
 INSTALLED_APPS = [
     "django.contrib.admin",
     "django.contrib.auth",
@@ -61,7 +65,9 @@ INSTALLED_APPS = [
 
 # MIDDLEWARE SETTINGS
 MIDDLEWARE = [
+    "config.middleware.timing.RequestTimingMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "config.middleware.replica.ReplicaPinMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -108,6 +114,26 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# The bounded hasher keeps the "pbkdf2_sha256" algorithm so existing hashes are checked on the
+# executor too, Django's PBKDF2PasswordHasher must not be listed as it would claim the algorithm
+PASSWORD_HASHERS = [
+    "app.core.hashers.BoundedPBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+    "django.contrib.auth.hashers.Argon2PasswordHasher",
+    "django.contrib.auth.hashers.BCryptSHA256PasswordHasher",
+    "django.contrib.auth.hashers.ScryptPasswordHasher",
+]
+
+# Iterations for app.core.hashers.BoundedPBKDF2PasswordHasher, run `manage.py tune_password_hasher` for a value
+PASSWORD_HASH_ITERATIONS = config("PASSWORD_HASH_ITERATIONS", default=0, cast=int) or None
+
+# Password hashing runs on a bounded thread pool, requests beyond workers + queue depth get a 503
+PASSWORD_HASHING_WORKERS = config("PASSWORD_HASHING_WORKERS", default=0, cast=int) or None
+
+PASSWORD_HASHING_QUEUE_DEPTH = config("PASSWORD_HASHING_QUEUE_DEPTH", default=16, cast=int)
+
+PASSWORD_HASHING_QUEUE_TIMEOUT = config("PASSWORD_HASHING_QUEUE_TIMEOUT", default=0.5, cast=float)
+
 
 # I18N AND L10N SETTINGS
 LANGUAGE_CODE = "en-us"
@@ -141,7 +167,7 @@ REST_FRAMEWORK = {
     "DEFAULT_PAGINATION_CLASS": "app.core.paginator.RestPagination",
     "PAGE_SIZE": 3,
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "app.user.authentication.CachedJWTAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
         "app.core.permissions.IsFullyGrantedPermission",
@@ -152,11 +178,121 @@ REST_FRAMEWORK = {
     #     'django_filters.rest_framework.DjangoFilterBackend'
     # ],
     # "EXCEPTION_HANDLER": "app.core.exceptions.custom_exception_handler",
+    "DEFAULT_RENDERER_CLASSES": [
+        "app.core.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "rest_framework.parsers.JSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
     # "DEFAULT_RENDERER_CLASSES": [
     #     "app.core.renderers.DefaultRenderer",
     # ],
 }
 
+# MessagePack responses and request bodies are negotiated when the optional msgpack package is installed
+if find_spec("msgpack"):
+    REST_FRAMEWORK["DEFAULT_RENDERER_CLASSES"].append("app.core.renderers.MessagePackRenderer")
+    REST_FRAMEWORK["DEFAULT_PARSER_CLASSES"].append("app.core.parsers.MessagePackParser")
+
+# Count used by app.core.paginator.RestPagination: exact, cached or estimated
+PAGINATION_COUNT_STRATEGY = config("PAGINATION_COUNT_STRATEGY", default="cached")
+
+PAGINATION_COUNT_CACHE_TIMEOUT = config("PAGINATION_COUNT_CACHE_TIMEOUT", default=60, cast=int)
+
+PAGINATION_COUNT_ESTIMATE_THRESHOLD = config("PAGINATION_COUNT_ESTIMATE_THRESHOLD", default=100000, cast=int)
+
+# Hard ceiling for the `limit` query parameter, pages above the threshold are streamed
+PAGINATION_MAX_PAGE_SIZE = config("PAGINATION_MAX_PAGE_SIZE", default=1000, cast=int)
+
+PAGINATION_STREAM_THRESHOLD = config("PAGINATION_STREAM_THRESHOLD", default=200, cast=int)
+
+PAGINATION_STREAM_CHUNK_SIZE = config("PAGINATION_STREAM_CHUNK_SIZE", default=100, cast=int)
+
+
+# DATABASE ROUTING SETTINGS
+DATABASE_ROUTERS = ["config.routers.UserShardRouter", "config.routers.PrimaryReplicaRouter"]
+
+# Aliases of the databases holding users, their profiles, OTPs and tokens, users are not sharded when empty.
+# Append new aliases at the end, then run `manage.py rebalance_user_shards`
+USER_SHARDS = []
+
+# Aliases of the read replicas in DATABASES, reads go to the primary when empty
+DATABASE_REPLICAS = []
+
+# Seconds the reads of a client stay on the primary database after one of its requests wrote
+DATABASE_REPLICA_STICKY_SECONDS = config("DATABASE_REPLICA_STICKY_SECONDS", default=5, cast=int)
+
+DATABASE_REPLICA_COOKIE = "pin_primary_db"
+
+
+# METRICS SETTINGS
+# Serve the per-view request histograms recorded by config.middleware.timing at /metrics
+METRICS_ENABLED = config("METRICS_ENABLED", default=False, cast=bool)
+
+# Bearer token required to read /metrics, the endpoint is only open without one when DEBUG is on
+METRICS_TOKEN = config("METRICS_TOKEN", default="")
+
+# Directory where each worker writes its histograms, set it (and clear it on start) when running several workers
+METRICS_DIR = config("METRICS_DIR", default="")
+
+METRICS_FLUSH_SECONDS = config("METRICS_FLUSH_SECONDS", default=1, cast=float)
+
+
+# CACHE SETTINGS
+# The shared tier of app.core.cache.tiered_cache, use a backend shared by all workers
+# (e.g. django.core.cache.backends.redis.RedisCache) outside of development
+CACHES = {
+    "default": {
+        "BACKEND": config("CACHE_BACKEND", default="django.core.cache.backends.locmem.LocMemCache"),
+        "LOCATION": config("CACHE_LOCATION", default="default"),
+        "TIMEOUT": config("CACHE_TIMEOUT", default=300, cast=int),
+    }
+}
+
+# Keys kept in the in-process tier of each worker, least recently used keys are evicted first
+CACHE_LOCAL_MAX_SIZE = config("CACHE_LOCAL_MAX_SIZE", default=1000, cast=int)
+
+# Seconds a key is served from the in-process tier, bounds staleness after an invalidation
+CACHE_LOCAL_TIMEOUT = config("CACHE_LOCAL_TIMEOUT", default=5, cast=int)
+
+
+# EMAIL OUTBOX SETTINGS
+EMAIL_OUTBOX_BATCH_SIZE = config("EMAIL_OUTBOX_BATCH_SIZE", default=50, cast=int)
+
+EMAIL_OUTBOX_MAX_ATTEMPTS = config("EMAIL_OUTBOX_MAX_ATTEMPTS", default=5, cast=int)
+
+EMAIL_OUTBOX_BACKOFF_SECONDS = config("EMAIL_OUTBOX_BACKOFF_SECONDS", default=30, cast=int)
+
+# Seconds a worker owns a claimed batch, emails of a worker that died while sending are retried after it
+EMAIL_OUTBOX_LEASE_SECONDS = config("EMAIL_OUTBOX_LEASE_SECONDS", default=300, cast=int)
+
+
+# OTP SETTINGS
+# Store used to keep and verify OTP codes: app.user.otp.DatabaseOTPStore or app.user.otp.CacheOTPStore
+OTP_STORE = config("OTP_STORE", default="app.user.otp.DatabaseOTPStore")
+
+# "stored" keeps random OTP secret keys on the user, "derived" computes them from OTP_MASTER_KEY
+OTP_SECRET_MODE = config("OTP_SECRET_MODE", default="stored")
+
+OTP_MASTER_KEY = config("OTP_MASTER_KEY", default="")
+
+# Rotation counter of each OTP purpose for the derived mode, bump a counter to rotate its keys
+OTP_SECRET_ROTATIONS = {purpose: 0 for purpose in ["auth", "reset_password", "transactions", "logout"]}
+
+
+# RETENTION SETTINGS
+# Days spent OTPs and expired tokens are kept before `manage.py purge_expired` deletes them
+RETENTION_OTP_DAYS = config("RETENTION_OTP_DAYS", default=7, cast=int)
+
+RETENTION_TOKEN_GRACE_DAYS = config("RETENTION_TOKEN_GRACE_DAYS", default=0, cast=int)
+
+RETENTION_BATCH_SIZE = config("RETENTION_BATCH_SIZE", default=500, cast=int)
+
+RETENTION_BATCH_SLEEP = config("RETENTION_BATCH_SLEEP", default=0.1, cast=float)
+
 
 # SIMPLE JWT #
 SIMPLE_JWT = {
@@ -187,6 +323,21 @@ SIMPLE_JWT = {
     # 'SLIDING_TOKEN_REFRESH_LIFETIME': timedelta(days=1),
 }
 
+# Seconds a token revocation lookup is kept in the shared and in-process caches
+TOKEN_REVOCATION_CACHE_TIMEOUT = config("TOKEN_REVOCATION_CACHE_TIMEOUT", default=300, cast=int)
+
+TOKEN_REVOCATION_LOCAL_TIMEOUT = config("TOKEN_REVOCATION_LOCAL_TIMEOUT", default=5, cast=int)
+
+TOKEN_REVOCATION_LOCAL_MAX_SIZE = config("TOKEN_REVOCATION_LOCAL_MAX_SIZE", default=10000, cast=int)
+
+# Seconds the user snapshot used by app.user.authentication.CachedJWTAuthentication is cached
+AUTH_USER_CACHE_TIMEOUT = config("AUTH_USER_CACHE_TIMEOUT", default=60, cast=int)
+
+# OutstandingToken rows are inserted once this many are buffered or after this many seconds, 1 disables buffering
+TOKEN_OUTSTANDING_BATCH_SIZE = config("TOKEN_OUTSTANDING_BATCH_SIZE", default=1, cast=int)
+
+TOKEN_OUTSTANDING_FLUSH_SECONDS = config("TOKEN_OUTSTANDING_FLUSH_SECONDS", default=5, cast=int)
+
 
 # CKEDITOR SETTINGS #
 CKEDITOR_IMAGE_BACKEND = "pillow"
@@ -18,9 +18,30 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR.parent / "db.sqlite3",
+        "CONN_MAX_AGE": config("DATABASE_CONN_MAX_AGE", default=0, cast=int),
+        "CONN_HEALTH_CHECKS": config("DATABASE_CONN_HEALTH_CHECKS", default=False, cast=bool),
     }
 }
 
+# Copy db.sqlite3 to db.replica.sqlite3 to try config.routers.PrimaryReplicaRouter locally
+if config("DATABASE_LOCAL_REPLICA", default=False, cast=bool):
+    DATABASES["replica"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR.parent / "db.replica.sqlite3",
+        "TEST": {"MIRROR": "default"},
+    }
+    DATABASE_REPLICAS = ["replica"]
+
+# Spread users over default and this many more SQLite files to try config.routers.UserShardRouter locally
+DATABASE_LOCAL_SHARDS = config("DATABASE_LOCAL_SHARDS", default=0, cast=int)
+for index in range(1, DATABASE_LOCAL_SHARDS + 1):
+    DATABASES[f"shard_{index}"] = {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR.parent / f"db.shard_{index}.sqlite3",
+    }
+if DATABASE_LOCAL_SHARDS:
+    USER_SHARDS = ["default"] + [f"shard_{index}" for index in range(1, DATABASE_LOCAL_SHARDS + 1)]
+
 
 # EMAIL SETTINGS
 EMAIL_BACKEND = "django.core.mail.backends.smtp.EmailBackend"
@@ -2,9 +2,65 @@
     Django settings for Production environment.
 """
 
+import django
+from decouple import Csv
+from django.core.exceptions import ImproperlyConfigured
 from .base import *
 
 
+# CACHE
+# revocations, authentication snapshots and lookups cached by one worker have to reach the others
+if CACHES["default"]["BACKEND"] == "django.core.cache.backends.locmem.LocMemCache":
+    raise ImproperlyConfigured(
+        "CACHE_BACKEND must be shared by all workers in production, e.g. django.core.cache.backends.redis.RedisCache"
+    )
+
+
+# DATABASE
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.postgresql",
+        "NAME": config("DATABASE_NAME"),
+        "USER": config("DATABASE_USER"),
+        "PASSWORD": config("DATABASE_PASSWORD"),
+        "HOST": config("DATABASE_HOST"),
+        "PORT": config("DATABASE_PORT", default="5432"),
+        # connections are reused across requests and checked before reuse after an error
+        "CONN_MAX_AGE": config("DATABASE_CONN_MAX_AGE", default=60, cast=int),
+        "CONN_HEALTH_CHECKS": config("DATABASE_CONN_HEALTH_CHECKS", default=True, cast=bool),
+        "OPTIONS": {"connect_timeout": config("DATABASE_CONNECT_TIMEOUT", default=5, cast=int)},
+    }
+}
+
+# Connection pooling needs Django >= 5.1 and psycopg 3 installed with the pool extra,
+# the pool replaces persistent connections. See app.core.database.pool_stats for saturation
+if config("DATABASE_POOL", default=False, cast=bool):
+    if django.VERSION < (5, 1):
+        # older versions ignore OPTIONS["pool"] and would silently open a connection per request
+        raise ImproperlyConfigured("DATABASE_POOL needs Django 5.1 or later, unset it or upgrade Django")
+    DATABASES["default"]["CONN_MAX_AGE"] = 0
+    DATABASES["default"]["OPTIONS"]["pool"] = {
+        "min_size": config("DATABASE_POOL_MIN_SIZE", default=2, cast=int),
+        "max_size": config("DATABASE_POOL_MAX_SIZE", default=10, cast=int),
+        "timeout": config("DATABASE_POOL_TIMEOUT", default=10, cast=float),
+        "max_idle": config("DATABASE_POOL_MAX_IDLE", default=600, cast=float),
+        "max_lifetime": config("DATABASE_POOL_MAX_LIFETIME", default=3600, cast=float),
+    }
+
+# Read replicas share the primary credentials, list their hosts in DATABASE_REPLICA_HOSTS
+for index, host in enumerate(config("DATABASE_REPLICA_HOSTS", default="", cast=Csv()), start=1):
+    DATABASES[f"replica_{index}"] = {**DATABASES["default"], "HOST": host, "TEST": {"MIRROR": "default"}}
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != "default"]
+
+# User shards share the primary credentials, list their hosts in DATABASE_SHARD_HOSTS in a stable order
+DATABASE_SHARD_HOSTS = config("DATABASE_SHARD_HOSTS", default="", cast=Csv())
+for index, host in enumerate(DATABASE_SHARD_HOSTS, start=1):
+    DATABASES[f"shard_{index}"] = {**DATABASES["default"], "HOST": host}
+if DATABASE_SHARD_HOSTS:
+    USER_SHARDS = ["default"] + [f"shard_{index}" for index in range(1, len(DATABASE_SHARD_HOSTS) + 1)]
+
+
 # SECURITY SETTINGS
 CSRF_COOKIE_SECURE = True
 CSRF_COOKIE_HTTPONLY = True
@@ -3,3 +3,29 @@
 """
 
 from .base import *
+
+
+# DATABASE
+# "replica" mirrors default and "shard_1" is an extra user shard, tests enable them with
+# override_settings(DATABASE_REPLICAS=["replica"]) or override_settings(USER_SHARDS=["default", "shard_1"])
+DATABASES = {
+    "default": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR.parent / "db.tests.sqlite3",
+    },
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR.parent / "db.tests.replica.sqlite3",
+        "TEST": {"MIRROR": "default"},
+    },
+    "shard_1": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR.parent / "db.tests.shard_1.sqlite3",
+    },
+}
+
+PASSWORD_HASH_ITERATIONS = 1000
+
+
+# EMAIL SETTINGS
+EMAIL_BACKEND = "django.core.mail.backends.locmem.EmailBackend"
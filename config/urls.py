@@ -5,6 +5,7 @@ URL configuration for config project.
 from django.contrib import admin
 from django.urls import path, include
 from django.conf.urls.static import static
+from app.core.views import metrics
 from .settings import base
 
 
@@ -27,6 +28,9 @@ urlpatterns = [
 
 urlpatterns += static(base.MEDIA_URL, document_root=base.MEDIA_ROOT)
 
+if base.METRICS_ENABLED:
+    urlpatterns += [path("metrics", metrics, name="metrics")]
+
 
 handler404 = "app.core.views.error_404"
 handler500 = "app.core.views.error_500"